@@ -0,0 +1,261 @@
+"""Response cache for shared (non-personalized) API payloads
+
+Entries are serialized response bodies stored under a key and a set of tags
+(e.g. "post:12", "feed:infra:all"). Writes invalidate by tag, so a vote only
+drops the pages that contain the voted post. Every entry also has a TTL,
+which bounds staleness for changes that aren't tracked by tags (e.g. a vote
+moving a post onto another page).
+
+Every invalidation bumps a generation counter and records it on the tags it
+dropped. A request reads generation() before its query and passes it to
+set(), which skips the write if any of the entry's tags were invalidated in
+the meantime. Otherwise a page read before a write commits could be cached
+again just after that write invalidated it. A page read from a lagging
+replica can predate a write that was invalidated before the request even
+started, so set() also takes quiet_seconds: the write is skipped if a tag was
+invalidated less than that long ago.
+
+CACHE_BACKEND selects the backend: "memory" (default, per process), "redis"
+(shared across workers, needs the redis package and REDIS_URL) or "none".
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Tags whose last invalidation generation the memory backend remembers
+INVALIDATION_HISTORY = 4096
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+class CacheBackend:
+    """Interface shared by the cache backends; also the "none" backend"""
+
+    def __init__(self):
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "stale_sets": 0, "invalidations": 0, "evictions": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def get(self, key: str) -> Optional[bytes]:
+        self._count("misses")
+        return None
+
+    def generation(self) -> int:
+        """Current invalidation generation; pass it to set() as since"""
+        return 0
+
+    def set(
+        self, key: str, value: bytes, tags: Iterable[str],
+        ttl: float = CACHE_TTL_SECONDS, since: Optional[int] = None, quiet_seconds: float = 0
+    ):
+        """Store value under key and tags, unless a tag was invalidated after
+        generation since or less than quiet_seconds ago"""
+        pass
+
+    def invalidate(self, tags: Iterable[str]):
+        pass
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["backend"] = type(self).__name__
+        return stats
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache with per-entry TTL and a tag -> keys index"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        super().__init__()
+        self._max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self._generation = 0
+        self._invalidated = OrderedDict()  # tag -> (generation, time) of its last invalidation, oldest first
+        self._forgotten = (0, 0.0)  # newest (generation, time) pruned from _invalidated
+        self._lock = threading.Lock()
+
+    def _drop(self, key: str):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        self._count("hits" if entry is not None else "misses")
+        return entry[1] if entry is not None else None
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def _invalidated_since(self, tags: frozenset, since: Optional[int], quiet_seconds: float) -> bool:
+        settled = time.monotonic() - quiet_seconds
+        forgotten_generation, forgotten_at = self._forgotten
+        if (since is not None and since < forgotten_generation) or (quiet_seconds and forgotten_at > settled):
+            # Too old to tell which tags changed since then
+            return True
+        for tag in tags:
+            generation, at = self._invalidated.get(tag, (0, 0.0))
+            if (since is not None and generation > since) or (quiet_seconds and at > settled):
+                return True
+        return False
+
+    def set(
+        self, key: str, value: bytes, tags: Iterable[str],
+        ttl: float = CACHE_TTL_SECONDS, since: Optional[int] = None, quiet_seconds: float = 0
+    ):
+        tags = frozenset(tags)
+        evicted = 0
+        with self._lock:
+            if self._invalidated_since(tags, since, quiet_seconds):
+                stale = True
+            else:
+                stale = False
+                self._store(key, value, tags, ttl)
+                while len(self._entries) > self._max_entries:
+                    self._drop(next(iter(self._entries)))
+                    evicted += 1
+        self._count("stale_sets" if stale else "sets")
+        if evicted:
+            self._count("evictions", evicted)
+
+    def _store(self, key: str, value: bytes, tags: frozenset, ttl: float):
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + ttl, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+    def invalidate(self, tags: Iterable[str]):
+        dropped = 0
+        with self._lock:
+            self._generation += 1
+            now = time.monotonic()
+            for tag in tags:
+                self._invalidated[tag] = (self._generation, now)
+                self._invalidated.move_to_end(tag)
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+                    dropped += 1
+            while len(self._invalidated) > INVALIDATION_HISTORY:
+                _, self._forgotten = self._invalidated.popitem(last=False)
+        if dropped:
+            self._count("invalidations", dropped)
+
+class RedisCache(CacheBackend):
+    """Redis-backed cache shared by all workers; tags are Redis sets of keys.
+
+    The generation is the "generation" counter, and each invalidated tag
+    keeps "<generation> <unix time>" of its last invalidation in "gen:<tag>"
+    for ten entry TTLs, well past the length of any request.
+    """
+
+    def __init__(self, url: str = REDIS_URL):
+        super().__init__()
+        import redis  # optional dependency, only needed for CACHE_BACKEND=redis
+        self._redis = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._redis.get(f"cache:{key}")
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def generation(self) -> int:
+        return int(self._redis.get("generation") or 0)
+
+    @staticmethod
+    def _invalidated_since(stamps: list, since: Optional[int], quiet_seconds: float) -> bool:
+        settled = time.time() - quiet_seconds
+        for stamp in stamps:
+            if stamp is None:
+                continue
+            generation, at = stamp.split()
+            if (since is not None and int(generation) > since) or (quiet_seconds and float(at) > settled):
+                return True
+        return False
+
+    def set(
+        self, key: str, value: bytes, tags: Iterable[str],
+        ttl: float = CACHE_TTL_SECONDS, since: Optional[int] = None, quiet_seconds: float = 0
+    ):
+        tags = list(set(tags))
+        with self._redis.pipeline() as pipe:
+            try:
+                if (since is not None or quiet_seconds) and tags:
+                    # An invalidation of any tag between this check and EXEC aborts the write
+                    gen_keys = [f"gen:{tag}" for tag in tags]
+                    pipe.watch(*gen_keys)
+                    if self._invalidated_since(pipe.mget(gen_keys), since, quiet_seconds):
+                        self._count("stale_sets")
+                        return
+                pipe.multi()
+                pipe.set(f"cache:{key}", value, px=int(ttl * 1000))
+                for tag in tags:
+                    pipe.sadd(f"tag:{tag}", key)
+                    pipe.pexpire(f"tag:{tag}", int(ttl * 1000))
+                pipe.execute()
+            except self._watch_error:
+                self._count("stale_sets")
+                return
+        self._count("sets")
+
+    def invalidate(self, tags: Iterable[str]):
+        tags = list(tags)
+        generation = self._redis.incr("generation")
+        stamp = f"{generation} {time.time():.3f}"
+        # Recorded before the entries are dropped, so a concurrent set() either
+        # sees it or has its entry dropped below
+        pipe = self._redis.pipeline(transaction=False)
+        for tag in tags:
+            pipe.set(f"gen:{tag}", stamp, px=int(CACHE_TTL_SECONDS * 10 * 1000))
+        pipe.execute()
+        dropped = 0
+        for tag in tags:
+            keys = self._redis.smembers(f"tag:{tag}")
+            if keys:
+                dropped += self._redis.delete(*[b"cache:" + key for key in keys])
+            self._redis.delete(f"tag:{tag}")
+        if dropped:
+            self._count("invalidations", dropped)
+
+def make_cache() -> CacheBackend:
+    if CACHE_BACKEND == "redis":
+        return RedisCache()
+    if CACHE_BACKEND == "none":
+        return CacheBackend()
+    return MemoryCache()
+
+response_cache = make_cache()
+
+def feed_tags(cause: str, severity: str) -> list:
+    """Tags of every cached feed page a new post with this cause/severity could appear on"""
+    return [
+        "feed:all:all",
+        f"feed:{cause}:all",
+        f"feed:all:{severity}",
+        f"feed:{cause}:{severity}",
+        "search",
+    ]
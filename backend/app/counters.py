@@ -0,0 +1,168 @@
+"""Vote counter modes
+
+In the default "direct" mode every vote applies its delta to posts.votes,
+which serializes voters on the post's row lock. In "sharded" mode the delta
+goes to one of VOTE_COUNTER_SHARDS rows in post_vote_shards and a background
+folder periodically moves the pending shard totals into posts.votes in one
+transaction. Reads add the pending shards on top of posts.votes, so the total
+they see is always consistent; only the sort order lags by up to one fold
+interval.
+
+In both modes the analytics rollups and cause_stats are never updated by
+writers: votes and new posts append their changes to post_rollup_deltas,
+tag_rollup_deltas and cause_stats_deltas, and the same folder moves them into
+post_rollups, tag_rollups and cause_stats. Many writers in one rollup cell or
+cause therefore never queue on its row. Folding the vote shards turns
+their totals into rollup deltas too. Breakdowns add the pending deltas (and
+pending shard votes in sharded mode), so they stay exact.
+"""
+import os
+import random
+import threading
+from sqlalchemy import text
+from app.db import engine
+
+VOTE_COUNTER_MODE = os.getenv("VOTE_COUNTER_MODE", "direct")  # "direct" or "sharded"
+VOTE_COUNTER_SHARDS = int(os.getenv("VOTE_COUNTER_SHARDS", "16"))
+VOTE_FOLD_INTERVAL_SECONDS = float(os.getenv("VOTE_FOLD_INTERVAL_SECONDS", "2"))
+
+_stop_folder = threading.Event()
+
+def is_sharded() -> bool:
+    return VOTE_COUNTER_MODE == "sharded"
+
+def pick_shard() -> int:
+    """Pick a random shard so concurrent voters rarely contend on the same row"""
+    return random.randrange(VOTE_COUNTER_SHARDS)
+
+# Advisory lock key so only one worker folds at a time
+FOLD_LOCK_ID = 7_420_001
+
+def fold_vote_shards(conn) -> int:
+    """Move all pending shard deltas into posts.votes, returning how many posts changed.
+
+    Draining and applying happen in one statement, so any reader's snapshot
+    sees a given delta either in a shard or in posts.votes, never both. The
+    same statement appends the per-cell vote sums to post_rollup_deltas,
+    where fold_rollup_deltas picks them up (a new post's cell may not be in
+    post_rollups yet). Returns 0 without doing anything if another worker is
+    already folding.
+    """
+    if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": FOLD_LOCK_ID}).scalar():
+        return 0
+    result = conn.execute(text("""
+        WITH drained AS (
+            DELETE FROM post_vote_shards
+            RETURNING post_id, delta
+        ),
+        totals AS (
+            SELECT post_id, SUM(delta) AS delta
+            FROM drained
+            GROUP BY post_id
+        ),
+        bumped AS (
+            UPDATE posts p
+            SET votes = p.votes + totals.delta
+            FROM totals
+            WHERE p.id = totals.post_id AND totals.delta <> 0
+            RETURNING p.cause, p.severity, p.category, p.year, totals.delta
+        ),
+        rollup AS (
+            INSERT INTO post_rollup_deltas (cause, severity, category, year, vote_sum)
+            SELECT cause, severity, category, year, SUM(delta)
+            FROM bumped
+            GROUP BY cause, severity, category, year
+        )
+        SELECT COUNT(*) FROM bumped
+    """))
+    return result.scalar()
+
+def fold_rollup_deltas(conn) -> int:
+    """Move all pending deltas into post_rollups, tag_rollups and cause_stats, returning how many rows changed.
+
+    Like fold_vote_shards, each table is drained and applied in one
+    statement, and nothing happens if another worker holds the fold lock.
+    """
+    if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": FOLD_LOCK_ID}).scalar():
+        return 0
+    cells = conn.execute(text("""
+        WITH drained AS (
+            DELETE FROM post_rollup_deltas
+            RETURNING cause, severity, category, year, post_count, vote_sum
+        ),
+        applied AS (
+            INSERT INTO post_rollups (cause, severity, category, year, post_count, vote_sum)
+            SELECT cause, severity, category, year, SUM(post_count), SUM(vote_sum)
+            FROM drained
+            GROUP BY cause, severity, category, year
+            ORDER BY cause, severity, category, year
+            ON CONFLICT (cause, severity, category, year) DO UPDATE
+            SET post_count = post_rollups.post_count + EXCLUDED.post_count,
+                vote_sum = post_rollups.vote_sum + EXCLUDED.vote_sum
+            RETURNING 1
+        )
+        SELECT COUNT(*) FROM applied
+    """)).scalar()
+    cells += conn.execute(text("""
+        WITH drained AS (
+            DELETE FROM tag_rollup_deltas
+            RETURNING tag, cause, severity, category, year, post_count
+        ),
+        applied AS (
+            INSERT INTO tag_rollups (tag, cause, severity, category, year, post_count)
+            SELECT tag, cause, severity, category, year, SUM(post_count)
+            FROM drained
+            GROUP BY tag, cause, severity, category, year
+            ORDER BY tag, cause, severity, category, year
+            ON CONFLICT (tag, cause, severity, category, year) DO UPDATE
+            SET post_count = tag_rollups.post_count + EXCLUDED.post_count
+            RETURNING 1
+        )
+        SELECT COUNT(*) FROM applied
+    """)).scalar()
+    cells += conn.execute(text("""
+        WITH drained AS (
+            DELETE FROM cause_stats_deltas
+            RETURNING cause, post_count
+        ),
+        applied AS (
+            INSERT INTO cause_stats (cause, post_count)
+            SELECT cause, SUM(post_count)
+            FROM drained
+            GROUP BY cause
+            ORDER BY cause
+            ON CONFLICT (cause) DO UPDATE
+            SET post_count = cause_stats.post_count + EXCLUDED.post_count
+            RETURNING 1
+        )
+        SELECT COUNT(*) FROM applied
+    """)).scalar()
+    return cells
+
+def fold_counters(conn):
+    """Fold the vote shards (sharded mode) and then the rollup deltas, which
+    include the shards' vote sums, in one transaction"""
+    if is_sharded():
+        fold_vote_shards(conn)
+    fold_rollup_deltas(conn)
+
+def _fold_loop():
+    while not _stop_folder.wait(VOTE_FOLD_INTERVAL_SECONDS):
+        try:
+            with engine.begin() as conn:
+                fold_counters(conn)
+        except Exception as e:
+            print(f"Error folding counters: {e}")
+
+def start_vote_folder():
+    """Start the background folder thread (vote shards and rollup deltas)"""
+    _stop_folder.clear()
+    threading.Thread(target=_fold_loop, name="vote-folder", daemon=True).start()
+    shards = f"{VOTE_COUNTER_SHARDS} vote shards, " if is_sharded() else ""
+    print(f"Started counter folder ({shards}rollup deltas, every {VOTE_FOLD_INTERVAL_SECONDS}s)")
+
+def stop_vote_folder():
+    """Stop the folder thread and fold whatever is still pending"""
+    _stop_folder.set()
+    with engine.begin() as conn:
+        fold_counters(conn)
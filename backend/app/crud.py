@@ -1,312 +1,666 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, or_, func as sql_func, text
-from app.models import Post, Tag
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text
+from app import counters
+from app.tag_cache import tag_cache, remember_after_commit
 from typing import Optional
+from datetime import datetime
+import base64
+import json
+import math
 import random
-import uuid
+import re
 
-def get_posts(
-    db: Session,
-    q: Optional[str] = None,
-    cause: str = "all",
-    severity: str = "all",
-    sort: str = "hot",
-    skip: int = 0,
-    limit: int = 100,
-    user_id: Optional[str] = None
-):
-    # If search query is provided, use Full-Text Search
-    if q and q.strip():
-        return _get_posts_with_fts(db, q.strip(), cause, severity, sort, skip, limit, user_id)
-    
-    # Otherwise use regular filtering
-    query = db.query(Post)
+def _encode_cursor(sort: str, key: list) -> str:
+    """Encode the sort tuple of the last row on a page as an opaque cursor"""
+    payload = json.dumps({"s": sort, "k": key}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
 
-    # Cause filter
-    if cause != "all":
-        query = query.filter(Post.cause == cause.lower())
+# SQL type of each keyset sort column, which cursor values must fit
+SORT_KEY_TYPES = {
+    "p.hot_score": "integer",
+    "p.year": "integer",
+    "p.votes": "integer",
+    "p.id": "integer",
+    "p.trend_score": "float",
+    "p.rank": "float",
+    "p.score": "float",
+}
 
-    # Severity filter
-    if severity != "all":
-        query = query.filter(Post.severity == severity.lower())
+def _cursor_value(value, sql_type: str):
+    """A cursor key value as a parameter of sql_type, raising ValueError if it does not fit"""
+    if isinstance(value, bool):
+        raise ValueError("Invalid cursor")
+    if sql_type == "integer" and isinstance(value, int) and -2**31 <= value < 2**31:
+        return value
+    if sql_type == "bigint" and isinstance(value, int) and -2**63 <= value < 2**63:
+        return value
+    if sql_type == "float" and isinstance(value, (int, float)) and math.isfinite(value):
+        return float(value)
+    if sql_type == "text" and isinstance(value, str):
+        return value
+    raise ValueError("Invalid cursor")
 
-    # Sorting
-    if sort == "new":
-        query = query.order_by(desc(Post.year))
-    elif sort == "top":
-        query = query.order_by(desc(Post.votes))
-    else:  # hot
-        # hot = (votes + (year - 2010) * 6) desc
-        query = query.order_by(desc(Post.votes + (Post.year - 2010) * 6))
+def _decode_cursor(cursor: str, sort: str, types: list) -> list:
+    """Decode a cursor produced by _encode_cursor whose key has the given SQL types,
+    raising ValueError if it is invalid"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key = payload["k"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if payload.get("s") != sort or not isinstance(key, list) or len(key) != len(types):
+        raise ValueError("Cursor does not match the requested sort")
+    return [_cursor_value(value, sql_type) for value, sql_type in zip(key, types)]
 
-    total = query.count()
-    posts = query.offset(skip).limit(limit).all()
+def _page_extras_sql(user_id: Optional[str]) -> str:
+    """Correlated subqueries that fold tags, pending vote shards and the user's vote/save into a page row"""
+    extras = """
+        ARRAY(
+            SELECT t.name FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+            WHERE pt.post_id = page.id
+        ) AS tags"""
+    if counters.is_sharded():
+        extras += """,
+        COALESCE(
+            (SELECT SUM(s.delta) FROM post_vote_shards s WHERE s.post_id = page.id),
+            0
+        ) AS pending_votes"""
+    if user_id:
+        extras += """,
+        COALESCE(
+            (SELECT v.value FROM votes v WHERE v.user_id = CAST(:user_id AS uuid) AND v.post_id = page.id),
+            0
+        ) AS user_vote,
+        EXISTS(
+            SELECT 1 FROM saves s WHERE s.user_id = CAST(:user_id AS uuid) AND s.post_id = page.id
+        ) AS saved"""
+    else:
+        extras += """,
+        0 AS user_vote,
+        false AS saved"""
+    return extras
 
-    # Convert to dict format with tags as string array
-    result = []
-    post_ids = [post.id for post in posts]
-    
-    # Fetch user-specific data if user_id provided
-    user_votes = {}
-    user_saves = set()
-    comment_counts = {}
+async def _fetch_page(
+    db: AsyncSession,
+    where_clauses: list,
+    params: dict,
+    sort_keys: list,
+    limit: int,
+    user_id: Optional[str] = None,
+    from_sql: str = "posts p",
+    offset: int = 0,
+    with_total: bool = False
+):
+    """Fetch a page of posts, with everything the feed renders, in a single statement.
+
+    sort_keys are SQL expressions over from_sql, all sorted descending; the
+    last one must be p.id so the order is total. The inner query picks the
+    page first so the per-row subqueries only run for rows that are returned.
+    with_total adds a window count of all matching rows, which is nearly free
+    when the whole match set has to be sorted anyway.
+    Returns (items, sort key values of each row, total or None).
+    """
+    sort_cols = ", ".join(f"{key} AS sort_{i}" for i, key in enumerate(sort_keys))
+    if with_total:
+        sort_cols += ", COUNT(*) OVER () AS total_count"
+    order_by = ", ".join(f"sort_{i} DESC" for i in range(len(sort_keys)))
     
+    query = text(f"""
+        SELECT page.*, {_page_extras_sql(user_id)}
+        FROM (
+            SELECT p.id, p.votes, p.title, p.product, p.year, p.category,
+                   p.cause, p.severity, p.summary, p.created_at, p.comment_count,
+                   {sort_cols}
+            FROM {from_sql}
+            WHERE {" AND ".join(where_clauses) or "true"}
+            ORDER BY {order_by}
+            LIMIT :limit OFFSET :offset
+        ) page
+        ORDER BY {order_by}
+    """)
+    params = dict(params, limit=limit, offset=offset)
     if user_id:
-        # Get user votes
-        votes_result = db.execute(
-            text("SELECT post_id, value FROM votes WHERE user_id = :user_id AND post_id = ANY(:post_ids)"),
-            {"user_id": user_id, "post_ids": post_ids}
-        )
-        user_votes = {row[0]: row[1] for row in votes_result}
-        
-        # Get user saves
-        saves_result = db.execute(
-            text("SELECT post_id FROM saves WHERE user_id = :user_id AND post_id = ANY(:post_ids)"),
-            {"user_id": user_id, "post_ids": post_ids}
-        )
-        user_saves = {row[0] for row in saves_result}
-        
-        # Get comment counts
-        counts_result = db.execute(
-            text("SELECT post_id, COUNT(*) as cnt FROM comments WHERE post_id = ANY(:post_ids) GROUP BY post_id"),
-            {"post_ids": post_ids}
-        )
-        comment_counts = {row[0]: row[1] for row in counts_result}
+        params["user_id"] = user_id
     
-    # Get comment counts for all posts if no user_id
-    if not user_id:
-        counts_result = db.execute(
-            text("SELECT post_id, COUNT(*) as cnt FROM comments WHERE post_id = ANY(:post_ids) GROUP BY post_id"),
-            {"post_ids": post_ids}
-        )
-        comment_counts = {row[0]: row[1] for row in counts_result}
-    
-    for post in posts:
-        post_dict = {
-            "id": post.id,
-            "votes": post.votes,
-            "title": post.title,
-            "product": post.product,
-            "year": post.year,
-            "category": post.category,
-            "cause": post.cause,
-            "severity": post.severity,
-            "summary": post.summary,
-            "tags": [tag.name for tag in post.tags],
-            "created_at": post.created_at,
-            "user_vote": user_votes.get(post.id, 0),
-            "saved": post.id in user_saves,
-            "comment_count": comment_counts.get(post.id, 0)
-        }
-        result.append(post_dict)
+    rows = (await db.execute(query, params)).fetchall()
+    
+    items = [_row_to_post(row._mapping) for row in rows]
+    keys = [[row._mapping[f"sort_{i}"] for i in range(len(sort_keys))] for row in rows]
+    total = None
+    if with_total:
+        total = rows[0]._mapping["total_count"] if rows else 0
+    return items, keys, total
 
-    return result, total
+def _row_to_post(row) -> dict:
+    """Convert a page row to the post dict returned by the API"""
+    return {
+        "id": row["id"],
+        "votes": row["votes"] + row.get("pending_votes", 0),
+        "title": row["title"],
+        "product": row["product"],
+        "year": row["year"],
+        "category": row["category"],
+        "cause": row["cause"],
+        "severity": row["severity"],
+        "summary": row["summary"],
+        "tags": list(row["tags"]),
+        "created_at": row["created_at"],
+        "user_vote": row["user_vote"],
+        "saved": row["saved"],
+        "comment_count": row["comment_count"]
+    }
 
-def _get_posts_with_fts(
-    db: Session,
-    q: str,
-    cause: str,
-    severity: str,
-    sort: str,
-    skip: int,
+async def _paginate(
+    db: AsyncSession,
+    where_clauses: list,
+    params: dict,
+    sort_name: str,
+    sort_keys: list,
+    cursor: Optional[str],
     limit: int,
-    user_id: Optional[str] = None
+    user_id: Optional[str],
+    include_total: bool,
+    from_sql: str = "posts p",
+    window_total: bool = False
 ):
-    """Get posts using PostgreSQL Full-Text Search"""
-    # Build WHERE clause for filters
-    where_clauses = ["search_tsv @@ websearch_to_tsquery('english', :q)"]
-    params = {"q": q}
+    """Apply keyset pagination over sort_keys and fetch one page plus the optional total.
+
+    With window_total the total comes from a window count in the page query
+    instead of a separate COUNT statement.
+    """
+    want_total = include_total and cursor is None
+    
+    # Get total count (first page only)
+    total = None
+    if want_total and not window_total:
+        count_query = text(f"""
+            SELECT COUNT(*)
+            FROM {from_sql}
+            WHERE {" AND ".join(where_clauses) or "true"}
+        """)
+        total = (await db.execute(count_query, params)).scalar()
+    
+    where_clauses = list(where_clauses)
+    params = dict(params)
+    if cursor is not None:
+        key = _decode_cursor(cursor, sort_name, [SORT_KEY_TYPES[sort_key] for sort_key in sort_keys])
+        names = [f":after_{i}" for i in range(len(sort_keys))]
+        where_clauses.append(f"({', '.join(sort_keys)}) < ({', '.join(names)})")
+        params.update({f"after_{i}": value for i, value in enumerate(key)})
+    
+    # Get one row past the page to know whether there is a next page
+    items, keys, page_total = await _fetch_page(
+        db, where_clauses, params, sort_keys, limit + 1, user_id,
+        from_sql=from_sql, with_total=want_total and window_total
+    )
+    if page_total is not None:
+        total = page_total
+    
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = _encode_cursor(sort_name, keys[limit - 1])
+    
+    return items, total, next_cursor
+
+def _filter_clauses(cause: str, severity: str, alias: str = "p"):
+    """WHERE clauses (on the posts table aliased alias) and params for the cause/severity filters"""
+    where_clauses = []
+    params = {}
     
     if cause != "all":
-        where_clauses.append("cause = :cause")
+        where_clauses.append(f"{alias}.cause = :cause")
         params["cause"] = cause.lower()
     
     if severity != "all":
-        where_clauses.append("severity = :severity")
+        where_clauses.append(f"{alias}.severity = :severity")
         params["severity"] = severity.lower()
     
-    where_sql = " AND ".join(where_clauses)
-    
-    # Build ORDER BY clause
-    # Primary: relevance rank, Secondary: requested sort
+    return where_clauses, params
+
+def _sort_sql(sort: str):
+    """Normalized sort name and the SQL expression it orders by"""
     if sort == "new":
-        order_by = "ts_rank_cd(search_tsv, websearch_to_tsquery('english', :q)) DESC, year DESC"
-    elif sort == "top":
-        order_by = "ts_rank_cd(search_tsv, websearch_to_tsquery('english', :q)) DESC, votes DESC"
-    else:  # hot
-        order_by = "ts_rank_cd(search_tsv, websearch_to_tsquery('english', :q)) DESC, (votes + (year - 2010) * 6) DESC"
-    
-    # Get total count
-    count_query = text(f"""
-        SELECT COUNT(*) 
-        FROM posts 
-        WHERE {where_sql}
-    """)
-    total = db.execute(count_query, params).scalar()
+        return "new", "p.year"
+    if sort == "top":
+        return "top", "p.votes"
+    if sort == "trending":
+        # time-decayed score kept up to date by the app.trending background job
+        return "trending", "p.trend_score"
+    # hot = (votes + (year - 2010) * 6) desc, stored in hot_score by a trigger
+    return "hot", "p.hot_score"
+
+def _fts_source(q: str):
+    """Derived table of posts matching q (websearch syntax) with their rank, and its params"""
+    from_sql = """(
+        SELECT posts.*, ts_rank_cd(posts.search_tsv, query) AS rank
+        FROM posts CROSS JOIN websearch_to_tsquery('english', :q) AS query
+        WHERE posts.search_tsv @@ query
+    ) p"""
+    return from_sql, {"q": q}
+
+# Candidates taken from each prefix search source (tsquery, title, product, tags)
+PREFIX_BRANCH_LIMIT = 200
+# Closest tag names whose posts are prefix search candidates
+PREFIX_TAG_LIMIT = 5
+# The prefix tsquery source is only used once some word is this long; shorter
+# prefixes expand to too many lexemes and are served by the trigram sources
+PREFIX_TSQUERY_MIN_CHARS = 4
+
+def _prefix_source(q: str, words: list, cause: str = "all", severity: str = "all"):
+    """Derived table of posts matching the word prefixes of q, or similar to q, with their score, and its params.
+
+    Each candidate source is capped at PREFIX_BRANCH_LIMIT rows, taken in
+    order of closeness: trigram KNN on the GiST indexes for title, product
+    and tag names, rank for the tsquery. Only the capped candidates are
+    scored, so the cost of a keystroke does not grow with the number of
+    matches. The cause/severity filters are applied inside each source.
+    """
+    filter_clauses, params = _filter_clauses(cause, severity, alias="posts")
+    filter_sql = "".join(f" AND {clause}" for clause in filter_clauses)
+    params.update({
+        "q": q,
+        "prefix_q": " & ".join(f"{word}:*" for word in words),
+        "branch_limit": PREFIX_BRANCH_LIMIT,
+        "tag_limit": PREFIX_TAG_LIMIT
+    })
+    tsquery_candidates = ""
+    if max(len(word) for word in words) >= PREFIX_TSQUERY_MIN_CHARS:
+        tsquery_candidates = f"""(
+                SELECT posts.id FROM posts, query WHERE posts.search_tsv @@ query.tsq{filter_sql}
+                ORDER BY ts_rank_cd(posts.search_tsv, query.tsq) DESC LIMIT :branch_limit
+            )
+            UNION
+            """
+    from_sql = f"""(
+        WITH query AS (
+            SELECT to_tsquery('english', :prefix_q) AS tsq
+        ),
+        candidates AS (
+            {tsquery_candidates}(
+                SELECT posts.id FROM posts WHERE :q <% posts.title{filter_sql}
+                ORDER BY :q <<-> posts.title LIMIT :branch_limit
+            )
+            UNION
+            (
+                SELECT posts.id FROM posts WHERE :q <% posts.product{filter_sql}
+                ORDER BY :q <<-> posts.product LIMIT :branch_limit
+            )
+            UNION
+            SELECT tagged.post_id
+            FROM (
+                SELECT t.id FROM tags t WHERE :q <% t.name
+                ORDER BY :q <<-> t.name LIMIT :tag_limit
+            ) matched
+            CROSS JOIN LATERAL (
+                SELECT pt.post_id FROM post_tags pt JOIN posts ON posts.id = pt.post_id
+                WHERE pt.tag_id = matched.id{filter_sql}
+                ORDER BY pt.post_id DESC LIMIT :branch_limit
+            ) tagged
+        )
+        SELECT posts.*,
+               ts_rank_cd(posts.search_tsv, query.tsq) + GREATEST(
+                   word_similarity(:q, posts.title),
+                   word_similarity(:q, posts.product),
+                   COALESCE((
+                       SELECT MAX(word_similarity(:q, t.name))
+                       FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+                       WHERE pt.post_id = posts.id
+                   ), 0)
+               ) AS score
+        FROM candidates
+        JOIN posts ON posts.id = candidates.id
+        CROSS JOIN query
+    ) p"""
+    return from_sql, params
+
+async def get_posts(
+    db: AsyncSession,
+    q: Optional[str] = None,
+    cause: str = "all",
+    severity: str = "all",
+    sort: str = "hot",
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    user_id: Optional[str] = None,
+    include_total: bool = True,
+    match: str = "fts"
+):
+    """Get a page of posts using keyset pagination.
+
+    match selects the search mode when q is given: "fts" matches whole
+    stemmed words, "prefix" matches word prefixes and tolerates typos.
+    Returns (items, total, next_cursor). total is only computed for the first
+    page (no cursor) when include_total is set, and never in prefix mode;
+    otherwise it is None.
+    """
+    # If search query is provided, use Full-Text Search
+    if q and q.strip():
+        if match == "prefix":
+            return await _get_posts_with_prefix(db, q.strip(), cause, severity, sort, cursor, limit, user_id)
+        return await _get_posts_with_fts(db, q.strip(), cause, severity, sort, cursor, limit, user_id, include_total)
     
-    # Get posts with tags
-    posts_query = text(f"""
-        SELECT id, votes, title, product, year, category, cause, severity, summary, created_at
-        FROM posts
-        WHERE {where_sql}
-        ORDER BY {order_by}
-        LIMIT :limit OFFSET :offset
-    """)
-    params["limit"] = limit
-    params["offset"] = skip
+    # Otherwise use regular filtering
+    where_clauses, params = _filter_clauses(cause, severity)
+    sort, sort_sql = _sort_sql(sort)
     
-    result = db.execute(posts_query, params)
-    rows = result.fetchall()
+    return await _paginate(
+        db, where_clauses, params, sort, [sort_sql, "p.id"],
+        cursor, limit, user_id, include_total
+    )
+
+async def _get_posts_with_fts(
+    db: AsyncSession,
+    q: str,
+    cause: str,
+    severity: str,
+    sort: str,
+    cursor: Optional[str],
+    limit: int,
+    user_id: Optional[str] = None,
+    include_total: bool = True
+):
+    """Get posts using PostgreSQL Full-Text Search.
+
+    The tsquery is parsed once and the rank computed once per matching row in
+    a derived table; rank, row data and the total all come from one statement.
+    """
+    where_clauses, params = _filter_clauses(cause, severity)
+    from_sql, search_params = _fts_source(q)
+    params.update(search_params)
     
-    # Fetch posts with tags
-    post_ids = [row[0] for row in rows]
-    posts = db.query(Post).filter(Post.id.in_(post_ids)).all()
+    # Primary: relevance rank, Secondary: requested sort
+    sort, sort_sql = _sort_sql(sort)
     
-    # Create a map for ordering
-    post_map = {post.id: post for post in posts}
+    return await _paginate(
+        db, where_clauses, params, f"search:{sort}", ["p.rank", sort_sql, "p.id"],
+        cursor, limit, user_id, include_total,
+        from_sql=from_sql, window_total=True
+    )
+
+async def _get_posts_with_prefix(
+    db: AsyncSession,
+    q: str,
+    cause: str,
+    severity: str,
+    sort: str,
+    cursor: Optional[str],
+    limit: int,
+    user_id: Optional[str] = None
+):
+    """Get posts matching word prefixes, tolerating typos (search-as-you-type).
+
+    Candidates are the union of a prefix tsquery match (every word as word:*)
+    and trigram word-similarity matches on title, product and tag names, each
+    capped to its closest PREFIX_BRANCH_LIMIT rows (see _prefix_source). They
+    are ranked by ts_rank_cd plus the best trigram similarity.
+
+    No total is computed: short prefixes match a large share of the table,
+    and a window count would make every keystroke materialize and sort all
+    candidate rows instead of keeping only the top page.
+    """
+    words = re.findall(r"[^\W_]+", q.lower())
+    if not words:
+        return await _get_posts_with_fts(db, q, cause, severity, sort, cursor, limit, user_id, include_total=False)
     
-    # Fetch user-specific data if user_id provided
-    user_votes = {}
-    user_saves = set()
-    comment_counts = {}
+    where_clauses, params = _filter_clauses(cause, severity)
+    from_sql, search_params = _prefix_source(q, words, cause, severity)
+    params.update(search_params)
     
-    if user_id:
-        # Get user votes
-        votes_result = db.execute(
-            text("SELECT post_id, value FROM votes WHERE user_id = :user_id AND post_id = ANY(:post_ids)"),
-            {"user_id": user_id, "post_ids": post_ids}
-        )
-        user_votes = {row[0]: row[1] for row in votes_result}
-        
-        # Get user saves
-        saves_result = db.execute(
-            text("SELECT post_id FROM saves WHERE user_id = :user_id AND post_id = ANY(:post_ids)"),
-            {"user_id": user_id, "post_ids": post_ids}
-        )
-        user_saves = {row[0] for row in saves_result}
-        
-        # Get comment counts
-        counts_result = db.execute(
-            text("SELECT post_id, COUNT(*) as cnt FROM comments WHERE post_id = ANY(:post_ids) GROUP BY post_id"),
-            {"post_ids": post_ids}
-        )
-        comment_counts = {row[0]: row[1] for row in counts_result}
+    # Primary: blended score, Secondary: requested sort
+    sort, sort_sql = _sort_sql(sort)
     
-    # Get comment counts for all posts if no user_id
-    if not user_id:
-        counts_result = db.execute(
-            text("SELECT post_id, COUNT(*) as cnt FROM comments WHERE post_id = ANY(:post_ids) GROUP BY post_id"),
-            {"post_ids": post_ids}
-        )
-        comment_counts = {row[0]: row[1] for row in counts_result}
-    
-    # Convert to dict format maintaining order
-    result_list = []
-    for post_id in post_ids:
-        if post_id in post_map:
-            post = post_map[post_id]
-            result_list.append({
-                "id": post.id,
-                "votes": post.votes,
-                "title": post.title,
-                "product": post.product,
-                "year": post.year,
-                "category": post.category,
-                "cause": post.cause,
-                "severity": post.severity,
-                "summary": post.summary,
-                "tags": [tag.name for tag in post.tags],
-                "created_at": post.created_at,
-                "user_vote": user_votes.get(post.id, 0),
-                "saved": post.id in user_saves,
-                "comment_count": comment_counts.get(post.id, 0)
-            })
-    
-    return result_list, total
-
-def create_post(db: Session, post_data: dict):
-    # Get or create tags
-    tag_names = post_data.get("tags", [])
-    if not tag_names:
-        # Default to cause if no tags provided
-        tag_names = [post_data["cause"]]
-
-    tags = []
-    for tag_name in tag_names:
-        tag = db.query(Tag).filter(Tag.name == tag_name.lower()).first()
-        if not tag:
-            tag = Tag(name=tag_name.lower())
-            db.add(tag)
-            db.flush()
-        tags.append(tag)
-
-    # Set initial random votes (80-430)
-    votes = random.randint(80, 430)
-
-    post = Post(
-        title=post_data["title"],
-        product=post_data["product"],
-        year=post_data["year"],
-        category=post_data["category"],
-        cause=post_data["cause"].lower(),
-        severity=post_data["severity"].lower(),
-        summary=post_data["summary"],
-        votes=votes,
-        tags=tags
+    return await _paginate(
+        db, where_clauses, params, f"prefix:{sort}", ["p.score", sort_sql, "p.id"],
+        cursor, limit, user_id, include_total=False,
+        from_sql=from_sql
     )
 
-    db.add(post)
-    db.flush()  # Flush to get post.id
+async def stream_posts_export(
+    db: AsyncSession,
+    q: Optional[str] = None,
+    cause: str = "all",
+    severity: str = "all",
+    sort: str = "hot",
+    match: str = "fts",
+    batch_size: int = 1000
+):
+    """Yield every post matching the /posts filters, in the same order, as dicts.
+
+    Rows come from a server-side cursor batch_size at a time, with tags
+    aggregated in SQL, so memory stays constant however many rows match.
+    The caller's transaction stays open for the whole export.
+    """
+    where_clauses, params = _filter_clauses(cause, severity)
+    sort, sort_sql = _sort_sql(sort)
+    sort_keys = [sort_sql, "p.id"]
+    from_sql = "posts p"
+    if q and q.strip():
+        q = q.strip()
+        words = re.findall(r"[^\W_]+", q.lower())
+        if match == "prefix" and words:
+            from_sql, search_params = _prefix_source(q, words, cause, severity)
+            sort_keys.insert(0, "p.score")
+        else:
+            from_sql, search_params = _fts_source(q)
+            sort_keys.insert(0, "p.rank")
+        params.update(search_params)
     
-    # Update search_tsv column
-    tags_str = " ".join([tag.name for tag in tags])
-    search_text = f"{post.title} {post.product} {post.category} {post.cause} {post.severity} {post.summary} {tags_str}".strip()
+    votes_sql = "p.votes"
+    if counters.is_sharded():
+        votes_sql += " + COALESCE((SELECT SUM(s.delta) FROM post_vote_shards s WHERE s.post_id = p.id), 0)"
     
-    db.execute(
-        text("""
-            UPDATE posts 
-            SET search_tsv = to_tsvector('english', :search_text)
-            WHERE id = :post_id
+    # Exports legitimately outlive DB_STATEMENT_TIMEOUT_MS
+    await db.execute(text("SET LOCAL statement_timeout = 0"))
+    result = await db.stream(
+        text(f"""
+            SELECT p.id, p.title, p.product, p.year, p.category, p.cause, p.severity, p.summary,
+                   {votes_sql} AS votes, p.comment_count, p.created_at,
+                   ARRAY(
+                       SELECT t.name FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+                       WHERE pt.post_id = p.id
+                       ORDER BY t.name
+                   ) AS tags
+            FROM {from_sql}
+            WHERE {" AND ".join(where_clauses) or "true"}
+            ORDER BY {", ".join(f"{key} DESC" for key in sort_keys)}
         """),
-        {"search_text": search_text, "post_id": post.id}
+        params,
+        execution_options={"yield_per": batch_size}
     )
-    
-    db.commit()
-    db.refresh(post)
+    async for row in result.mappings():
+        yield dict(row)
+
+async def create_post(db: AsyncSession, post_data: dict):
+    """Create one post; the single-row case of insert_posts"""
+    created = (await insert_posts(db, [post_data]))[0]
+    await db.commit()
+    return created
 
-    # Return as dict with tags array
+def _prepare_post(post_data: dict) -> dict:
+    """Normalize an incoming post: lowercase cause/severity/tags, default tags and votes"""
+    cause = post_data["cause"].lower()
+    # Default to cause if no tags provided; a post links each tag once
+    tags = list(dict.fromkeys(tag.lower() for tag in post_data.get("tags") or [cause]))
+    votes = post_data.get("votes")
+    if votes is None:
+        # Set initial random votes (80-430)
+        votes = random.randint(80, 430)
     return {
-        "id": post.id,
-        "votes": post.votes,
-        "title": post.title,
-        "product": post.product,
-        "year": post.year,
-        "category": post.category,
-        "cause": post.cause,
-        "severity": post.severity,
-        "summary": post.summary,
-        "tags": [tag.name for tag in post.tags],
-        "created_at": post.created_at
+        "title": post_data["title"],
+        "product": post_data["product"],
+        "year": post_data["year"],
+        "category": post_data["category"],
+        "cause": cause,
+        "severity": post_data["severity"].lower(),
+        "summary": post_data["summary"],
+        "votes": votes,
+        "tags": tags
     }
 
-def get_top_causes(db: Session, limit: int = 4):
-    # Count posts by cause
-    cause_counts = (
-        db.query(
-            Post.cause,
-            sql_func.count(Post.id).label('count')
+async def resolve_tag_ids(db: AsyncSession, names: list) -> dict:
+    """Map tag names to ids, creating missing tags.
+
+    Names in the process-wide tag cache cost nothing; the rest are resolved
+    by one upsert, in sorted order so concurrent batches lock existing tag
+    rows consistently. DO UPDATE (rather than DO NOTHING) makes RETURNING
+    include tags that already existed.
+    """
+    found, missing = tag_cache.lookup(names)
+    if not missing:
+        return found
+    rows = (await db.execute(
+        text("""
+            INSERT INTO tags (name)
+            SELECT DISTINCT unnest(CAST(:names AS text[])) AS name
+            ORDER BY name
+            ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+            RETURNING id, name
+        """),
+        {"names": missing}
+    )).fetchall()
+    resolved = {name: tag_id for tag_id, name in rows}
+    remember_after_commit(db.sync_session, resolved)
+    return {**found, **resolved}
+
+async def insert_posts(db: AsyncSession, posts: list) -> list:
+    """Insert a batch of posts with their tags and stats (part of the caller's transaction).
+
+    Tags are resolved in one statement; everything else (posts, post_tags,
+    the cause_stats and analytics rollup deltas) is written by one more statement
+    that takes the batch as column arrays. Post ids are drawn from the
+    sequence up front so post_tags rows can reference them. search_tsv is
+    computed with the tags in the INSERT itself, so the post_tags trigger
+    finds it current and does not rewrite the row. Returns the created posts
+    as dicts, in input order.
+    """
+    posts = [_prepare_post(post) for post in posts]
+    if not posts:
+        return []
+    tag_ids = await resolve_tag_ids(db, {tag for post in posts for tag in post["tags"]})
+    links = [(ord, tag) for ord, post in enumerate(posts, start=1) for tag in post["tags"]]
+
+    rows = (await db.execute(
+        text("""
+            WITH new_posts AS MATERIALIZED (
+                SELECT CAST(nextval(pg_get_serial_sequence('posts', 'id')) AS integer) AS id, r.*
+                FROM unnest(
+                    CAST(:titles AS text[]), CAST(:products AS text[]), CAST(:years AS integer[]),
+                    CAST(:categories AS text[]), CAST(:causes AS text[]), CAST(:severities AS text[]),
+                    CAST(:summaries AS text[]), CAST(:votes AS integer[])
+                ) WITH ORDINALITY AS r(title, product, year, category, cause, severity, summary, votes, ord)
+            ),
+            new_links AS (
+                SELECT p.id AS post_id, p.ord, l.tag_id, l.tag, p.cause, p.severity, p.category, p.year
+                FROM unnest(
+                    CAST(:link_ords AS bigint[]), CAST(:link_tag_ids AS integer[]), CAST(:link_tags AS text[])
+                ) AS l(ord, tag_id, tag)
+                JOIN new_posts p ON p.ord = l.ord
+            ),
+            inserted AS (
+                -- Tags in name order, as the search triggers concatenate them
+                INSERT INTO posts (id, title, product, year, category, cause, severity, summary, votes, search_tsv)
+                SELECT id, title, product, year, category, cause, severity, summary, votes,
+                       posts_search_document(
+                           title, product, category, cause, severity, summary,
+                           (SELECT string_agg(l.tag, ' ' ORDER BY l.tag) FROM new_links l WHERE l.ord = new_posts.ord)
+                       )
+                FROM new_posts
+                RETURNING id, created_at
+            ),
+            linked AS (
+                INSERT INTO post_tags (post_id, tag_id)
+                SELECT post_id, tag_id FROM new_links
+            ),
+            causes AS (
+                INSERT INTO cause_stats_deltas (cause, post_count)
+                SELECT cause, COUNT(*) FROM new_posts
+                GROUP BY cause
+            ),
+            cube AS (
+                INSERT INTO post_rollup_deltas (cause, severity, category, year, post_count, vote_sum)
+                SELECT cause, severity, category, year, COUNT(*), SUM(votes) FROM new_posts
+                GROUP BY cause, severity, category, year
+            ),
+            tagged AS (
+                INSERT INTO tag_rollup_deltas (tag, cause, severity, category, year, post_count)
+                SELECT tag, cause, severity, category, year, COUNT(*) FROM new_links
+                GROUP BY tag, cause, severity, category, year
+            )
+            SELECT inserted.id, inserted.created_at
+            FROM inserted JOIN new_posts USING (id)
+            ORDER BY new_posts.ord
+        """),
+        {
+            "titles": [post["title"] for post in posts],
+            "products": [post["product"] for post in posts],
+            "years": [post["year"] for post in posts],
+            "categories": [post["category"] for post in posts],
+            "causes": [post["cause"] for post in posts],
+            "severities": [post["severity"] for post in posts],
+            "summaries": [post["summary"] for post in posts],
+            "votes": [post["votes"] for post in posts],
+            "link_ords": [ord for ord, _ in links],
+            "link_tag_ids": [tag_ids[tag] for _, tag in links],
+            "link_tags": [tag for _, tag in links]
+        }
+    )).fetchall()
+
+    return [dict(post, id=row[0], created_at=row[1]) for post, row in zip(posts, rows)]
+
+async def rebuild_cause_stats(db: AsyncSession) -> int:
+    """Recompute cause_stats from posts, returning the number of causes.
+
+    Like rebuild_rollups, this never blocks writers: they only append to
+    cause_stats_deltas, and the pending deltas are dropped by the same
+    statement that counts posts, from the same snapshot.
+    """
+    await db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": counters.FOLD_LOCK_ID})
+    await db.execute(text("""
+        WITH actual AS (
+            SELECT cause, COUNT(*) AS post_count FROM posts GROUP BY cause
+        ),
+        drained AS (
+            DELETE FROM cause_stats_deltas
+        ),
+        stale AS (
+            DELETE FROM cause_stats WHERE cause NOT IN (SELECT cause FROM actual)
         )
-        .group_by(Post.cause)
-        .order_by(desc(sql_func.count(Post.id)))
-        .limit(limit)
-        .all()
-    )
+        INSERT INTO cause_stats (cause, post_count)
+        SELECT cause, post_count FROM actual
+        ON CONFLICT (cause) DO UPDATE SET post_count = EXCLUDED.post_count
+    """))
+    causes = (await db.execute(text("SELECT COUNT(*) FROM cause_stats"))).scalar()
+    await db.commit()
+    return causes
+
+async def get_top_causes(db: AsyncSession, limit: int = 4):
+    """Top causes by post count, read from cause_stats plus its pending deltas"""
+    # The window total is computed over every cause before LIMIT applies
+    rows = (await db.execute(
+        text("""
+            SELECT cause, post_count, CAST(SUM(post_count) OVER () AS bigint) AS total
+            FROM (
+                SELECT cause, SUM(post_count) AS post_count
+                FROM (
+                    SELECT cause, post_count FROM cause_stats
+                    UNION ALL
+                    SELECT cause, post_count FROM cause_stats_deltas
+                ) AS counts
+                GROUP BY cause
+            ) AS causes
+            WHERE post_count > 0
+            ORDER BY post_count DESC, cause
+            LIMIT :limit
+        """),
+        {"limit": limit}
+    )).fetchall()
 
-    # Get total count
-    total_posts = db.query(Post).count()
+    total_posts = rows[0][2] if rows else 0
 
     result = []
-    for cause, count in cause_counts:
+    for cause, count, _ in rows:
         if total_posts == 0:
             percent = 0
         else:
@@ -321,218 +675,523 @@ def get_top_causes(db: Session, limit: int = 4):
 
     return result, total_posts
 
-def create_anonymous_user(db: Session) -> str:
+async def rebuild_rollups(db: AsyncSession) -> int:
+    """Recompute post_rollups and tag_rollups from posts, returning the number of cube cells.
+
+    Writers only append to the delta tables, so nothing is blocked: each table
+    is rebuilt by one statement that aggregates posts and drops the pending
+    deltas from the same snapshot (they are already in what it counts). The
+    fold lock keeps the counter folder, the only other rollup writer, out.
+    """
+    await db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": counters.FOLD_LOCK_ID})
+    cells = (await db.execute(text("""
+        WITH actual AS (
+            SELECT cause, severity, category, year, COUNT(*) AS post_count, SUM(votes) AS vote_sum
+            FROM posts
+            GROUP BY cause, severity, category, year
+        ),
+        drained AS (
+            DELETE FROM post_rollup_deltas
+        ),
+        stale AS (
+            DELETE FROM post_rollups r
+            WHERE NOT EXISTS (
+                SELECT 1 FROM actual a
+                WHERE a.cause = r.cause AND a.severity = r.severity
+                  AND a.category = r.category AND a.year = r.year
+            )
+        ),
+        applied AS (
+            INSERT INTO post_rollups (cause, severity, category, year, post_count, vote_sum)
+            SELECT cause, severity, category, year, post_count, vote_sum FROM actual
+            ON CONFLICT (cause, severity, category, year) DO UPDATE
+            SET post_count = EXCLUDED.post_count, vote_sum = EXCLUDED.vote_sum
+            RETURNING 1
+        )
+        SELECT COUNT(*) FROM applied
+    """))).scalar()
+    await db.execute(text("""
+        WITH actual AS (
+            SELECT t.name AS tag, p.cause, p.severity, p.category, p.year, COUNT(*) AS post_count
+            FROM posts p
+            JOIN post_tags pt ON pt.post_id = p.id
+            JOIN tags t ON t.id = pt.tag_id
+            GROUP BY t.name, p.cause, p.severity, p.category, p.year
+        ),
+        drained AS (
+            DELETE FROM tag_rollup_deltas
+        ),
+        stale AS (
+            DELETE FROM tag_rollups r
+            WHERE NOT EXISTS (
+                SELECT 1 FROM actual a
+                WHERE a.tag = r.tag AND a.cause = r.cause AND a.severity = r.severity
+                  AND a.category = r.category AND a.year = r.year
+            )
+        )
+        INSERT INTO tag_rollups (tag, cause, severity, category, year, post_count)
+        SELECT tag, cause, severity, category, year, post_count FROM actual
+        ON CONFLICT (tag, cause, severity, category, year) DO UPDATE
+        SET post_count = EXCLUDED.post_count
+    """))
+    await db.commit()
+    return cells
+
+ROLLUP_DIMENSIONS = ("cause", "severity", "category", "year", "tag")
+
+def _post_rollups_sql() -> str:
+    """post_rollups plus its pending deltas, and pending shard votes in sharded mode"""
+    shards = ""
+    if counters.is_sharded():
+        shards = """
+    UNION ALL
+    SELECT p.cause, p.severity, p.category, p.year, 0, s.delta
+    FROM post_vote_shards s JOIN posts p ON p.id = s.post_id"""
+    return f"""(
+    SELECT cause, severity, category, year, post_count, vote_sum FROM post_rollups
+    UNION ALL
+    SELECT cause, severity, category, year, post_count, vote_sum FROM post_rollup_deltas{shards}
+) rollups"""
+
+# tag_rollups plus the deltas the counter folder hasn't applied yet
+TAG_ROLLUPS_SQL = """(
+    SELECT tag, cause, severity, category, year, post_count FROM tag_rollups
+    UNION ALL
+    SELECT tag, cause, severity, category, year, post_count FROM tag_rollup_deltas
+) rollups"""
+
+async def get_breakdown(db: AsyncSession, by: list, filters: dict, limit: int = 100):
+    """Post counts (and vote sums) grouped by any combination of rollup dimensions.
+
+    filters maps dimension names to required values (None means any). Grouping
+    or filtering by tag reads tag_rollups, where a post counts once per tag and
+    vote sums are not tracked; everything else reads post_rollups. Raises
+    ValueError for unknown dimensions.
+    """
+    unknown = [dim for dim in list(by) + list(filters) if dim not in ROLLUP_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension: {unknown[0]}")
+    by = list(dict.fromkeys(by))
+    filters = {dim: value for dim, value in filters.items() if value is not None}
+    
+    where_sql = " AND ".join(f"{dim} = :{dim}" for dim in filters) or "true"
+    by_tag = "tag" in by or "tag" in filters
+    table = TAG_ROLLUPS_SQL if by_tag else _post_rollups_sql()
+    votes_sql = "NULL" if by_tag else "SUM(vote_sum)"
+    # Each post is counted once in post_rollups, and once per tag in
+    # tag_rollups, so a single tag filter still gives an exact total
+    total_table = TAG_ROLLUPS_SQL if "tag" in filters else _post_rollups_sql()
+    select_by = "".join(f"{dim}, " for dim in by)
+    group_by = f"GROUP BY {', '.join(by)}" if by else ""
+    
+    rows = (await db.execute(
+        text(f"""
+            SELECT {select_by}SUM(post_count) AS count, {votes_sql} AS votes,
+                   (SELECT COALESCE(SUM(post_count), 0) FROM {total_table} WHERE {where_sql}) AS total
+            FROM {table}
+            WHERE {where_sql}
+            {group_by}
+            HAVING SUM(post_count) > 0
+            ORDER BY count DESC
+            LIMIT :limit
+        """),
+        dict(filters, limit=limit)
+    )).fetchall()
+    
+    total = rows[0]._mapping["total"] if rows else 0
+    items = []
+    for row in rows:
+        mapping = row._mapping
+        item = {dim: mapping[dim] for dim in by}
+        item["count"] = mapping["count"]
+        item["votes"] = mapping["votes"]
+        items.append(item)
+    return items, total
+
+async def create_anonymous_user(db: AsyncSession) -> str:
     """Create an anonymous user and return the user_id"""
-    result = db.execute(text("INSERT INTO users DEFAULT VALUES RETURNING id"))
+    result = await db.execute(text("INSERT INTO users DEFAULT VALUES RETURNING id"))
     user_id = str(result.fetchone()[0])
-    db.commit()
+    await db.commit()
     return user_id
 
-def ensure_user(db: Session, user_id: str):
+async def ensure_user(db: AsyncSession, user_id: str):
     """Ensure user exists, creating it if needed"""
-    db.execute(
+    await db.execute(
         text("INSERT INTO users(id) VALUES (:id) ON CONFLICT DO NOTHING"),
         {"id": user_id}
     )
-    db.flush()
+    await db.flush()
 
-def vote_post(db: Session, user_id: str, post_id: int, value: int):
-    """Vote on a post. value: -1 (downvote), 0 (remove), 1 (upvote)"""
-    # Ensure user exists
-    ensure_user(db, user_id)
-    
-    # Get current vote if exists
-    current_vote = db.execute(
-        text("SELECT value FROM votes WHERE user_id = :user_id AND post_id = :post_id"),
-        {"user_id": user_id, "post_id": post_id}
-    ).fetchone()
-    
-    current_value = current_vote[0] if current_vote else 0
+async def vote_post(db: AsyncSession, user_id: str, post_id: int, value: int):
+    """Vote on a post. value: -1 (downvote), 0 (remove), 1 (upvote)
+
+    Runs as a single statement: the user, the vote row and the vote counter
+    (posts.votes, or a counter shard in sharded mode) are all written by one CTE. The counter delta is derived from what
+    the upsert/delete actually changed, not from an earlier read, so concurrent
+    votes never double count. Returns None if the post does not exist.
+    """
+    # Votes are constrained to -1/1, so an upsert that changes the value always
+    # flips it (delta 2 * value) and a fresh insert adds value. Parameters that
+    # only appear in a SELECT list are cast, since asyncpg prepares statements
+    # server-side and Postgres would otherwise type them as text.
+    vote_ctes = """
+        WITH voter AS (
+            INSERT INTO users (id) VALUES (CAST(:user_id AS uuid))
+            ON CONFLICT DO NOTHING
+        ),
+        cast_vote AS (
+            INSERT INTO votes (user_id, post_id, value)
+            SELECT CAST(:user_id AS uuid), p.id, CAST(:value AS smallint)
+            FROM posts p
+            WHERE p.id = :post_id AND :value <> 0
+            ON CONFLICT (user_id, post_id) DO UPDATE
+            SET value = EXCLUDED.value, created_at = now()
+            WHERE votes.value <> EXCLUDED.value
+            RETURNING CASE WHEN xmax = 0 THEN value ELSE 2 * value END AS delta
+        ),
+        removed AS (
+            DELETE FROM votes
+            WHERE :value = 0 AND user_id = CAST(:user_id AS uuid) AND post_id = :post_id
+            RETURNING -value AS delta
+        ),
+        change AS (
+            SELECT COALESCE((SELECT SUM(delta) FROM cast_vote), 0)
+                 + COALESCE((SELECT SUM(delta) FROM removed), 0) AS delta
+        )"""
+    params = {"user_id": user_id, "post_id": post_id, "value": value}
     
-    if value == 0:
-        # Remove vote
-        if current_vote:
-            db.execute(
-                text("DELETE FROM votes WHERE user_id = :user_id AND post_id = :post_id"),
-                {"user_id": user_id, "post_id": post_id}
-            )
-            # Update post votes
-            db.execute(
-                text("UPDATE posts SET votes = votes - :current_value WHERE id = :post_id"),
-                {"current_value": current_value, "post_id": post_id}
-            )
-            new_vote_value = 0
+    if counters.is_sharded():
+        # Spread the delta over counter shards instead of locking the post row.
+        # The final SELECT can't see this statement's shard write, so add it.
+        query = vote_ctes + """,
+        bump AS (
+            INSERT INTO post_vote_shards (post_id, shard, delta)
+            SELECT :post_id, CAST(:shard AS smallint), delta FROM change WHERE delta <> 0
+            ON CONFLICT (post_id, shard) DO UPDATE
+            SET delta = post_vote_shards.delta + EXCLUDED.delta
+        )
+        SELECT p.votes
+            + COALESCE((SELECT SUM(s.delta) FROM post_vote_shards s WHERE s.post_id = p.id), 0)
+            + (SELECT delta FROM change)
+        FROM posts p
+        WHERE p.id = :post_id
+        """
+        params["shard"] = counters.pick_shard()
     else:
-        # Upsert vote
-        if current_vote:
-            # Update existing vote
-            db.execute(
-                text("UPDATE votes SET value = :value WHERE user_id = :user_id AND post_id = :post_id"),
-                {"value": value, "user_id": user_id, "post_id": post_id}
-            )
-            # Update post votes: subtract old value, add new value
-            db.execute(
-                text("UPDATE posts SET votes = votes - :current_value + :new_value WHERE id = :post_id"),
-                {"current_value": current_value, "new_value": value, "post_id": post_id}
-            )
-            new_vote_value = value
-        else:
-            # Insert new vote
-            db.execute(
-                text("INSERT INTO votes (user_id, post_id, value) VALUES (:user_id, :post_id, :value)"),
-                {"user_id": user_id, "post_id": post_id, "value": value}
-            )
-            # Update post votes
-            db.execute(
-                text("UPDATE posts SET votes = votes + :value WHERE id = :post_id"),
-                {"value": value, "post_id": post_id}
-            )
-            new_vote_value = value
+        # The rollup change is appended to post_rollup_deltas rather than
+        # applied to the shared rollup row, so votes on other posts in the same
+        # cell don't queue behind this one; the counter folder applies it
+        query = vote_ctes + """,
+        rollup AS (
+            INSERT INTO post_rollup_deltas (cause, severity, category, year, vote_sum)
+            SELECT p.cause, p.severity, p.category, p.year, change.delta
+            FROM posts p, change
+            WHERE p.id = :post_id AND change.delta <> 0
+        )
+        UPDATE posts
+        SET votes = votes + (SELECT delta FROM change)
+        WHERE id = :post_id
+        RETURNING votes
+        """
     
-    db.commit()
+    row = (await db.execute(text(query), params)).fetchone()
+    await db.commit()
     
-    # Get updated vote count
-    post_votes = db.execute(
-        text("SELECT votes FROM posts WHERE id = :post_id"),
-        {"post_id": post_id}
-    ).fetchone()[0]
+    if row is None:
+        return None
     
     return {
         "post_id": post_id,
-        "votes": post_votes,
-        "user_vote": new_vote_value
+        "votes": row[0],
+        "user_vote": value
     }
 
-def save_post(db: Session, user_id: str, post_id: int):
+async def save_post(db: AsyncSession, user_id: str, post_id: int):
     """Save a post for a user"""
     # Ensure user exists
-    ensure_user(db, user_id)
+    await ensure_user(db, user_id)
     
-    db.execute(
+    await db.execute(
         text("INSERT INTO saves (user_id, post_id) VALUES (:user_id, :post_id) ON CONFLICT DO NOTHING"),
         {"user_id": user_id, "post_id": post_id}
     )
-    db.commit()
+    await db.commit()
 
-def unsave_post(db: Session, user_id: str, post_id: int):
+async def unsave_post(db: AsyncSession, user_id: str, post_id: int):
     """Unsave a post for a user"""
     # Ensure user exists
-    ensure_user(db, user_id)
+    await ensure_user(db, user_id)
     
-    db.execute(
+    await db.execute(
         text("DELETE FROM saves WHERE user_id = :user_id AND post_id = :post_id"),
         {"user_id": user_id, "post_id": post_id}
     )
-    db.commit()
+    await db.commit()
 
-def get_saved_posts(db: Session, user_id: str, skip: int = 0, limit: int = 100):
-    """Get saved posts for a user"""
-    # Ensure user exists
-    ensure_user(db, user_id)
-    
-    saved_post_ids = db.execute(
-        text("SELECT post_id FROM saves WHERE user_id = :user_id ORDER BY created_at DESC LIMIT :limit OFFSET :skip"),
-        {"user_id": user_id, "limit": limit, "skip": skip}
-    ).fetchall()
-    
-    post_ids = [row[0] for row in saved_post_ids]
-    
-    if not post_ids:
-        return [], 0
-    
-    posts = db.query(Post).filter(Post.id.in_(post_ids)).all()
-    
-    # Maintain order
-    post_map = {post.id: post for post in posts}
-    ordered_posts = [post_map[pid] for pid in post_ids if pid in post_map]
-    
-    # Get user votes, saves, comment counts
-    user_votes = {}
-    user_saves = set(post_ids)
-    comment_counts = {}
-    
-    votes_result = db.execute(
-        text("SELECT post_id, value FROM votes WHERE user_id = :user_id AND post_id = ANY(:post_ids)"),
-        {"user_id": user_id, "post_ids": post_ids}
-    )
-    user_votes = {row[0]: row[1] for row in votes_result}
-    
-    counts_result = db.execute(
-        text("SELECT post_id, COUNT(*) as cnt FROM comments WHERE post_id = ANY(:post_ids) GROUP BY post_id"),
-        {"post_ids": post_ids}
+async def get_saved_posts(db: AsyncSession, user_id: str, skip: int = 0, limit: int = 100):
+    """Get saved posts for a user (read-only, so it can run on a replica)"""
+    result, _, _ = await _fetch_page(
+        db,
+        ["sv.user_id = CAST(:user_id AS uuid)"],
+        {},
+        ["sv.created_at", "p.id"],
+        limit,
+        user_id,
+        from_sql="saves sv JOIN posts p ON p.id = sv.post_id",
+        offset=skip
     )
-    comment_counts = {row[0]: row[1] for row in counts_result}
     
-    result = []
-    for post in ordered_posts:
-        result.append({
-            "id": post.id,
-            "votes": post.votes,
-            "title": post.title,
-            "product": post.product,
-            "year": post.year,
-            "category": post.category,
-            "cause": post.cause,
-            "severity": post.severity,
-            "summary": post.summary,
-            "tags": [tag.name for tag in post.tags],
-            "created_at": post.created_at,
-            "user_vote": user_votes.get(post.id, 0),
-            "saved": True,
-            "comment_count": comment_counts.get(post.id, 0)
-        })
-    
-    total = db.execute(
+    total = (await db.execute(
         text("SELECT COUNT(*) FROM saves WHERE user_id = :user_id"),
         {"user_id": user_id}
-    ).fetchone()[0]
+    )).fetchone()[0]
     
     return result, total
 
-def get_comments(db: Session, post_id: int):
-    """Get comments for a post"""
-    comments = db.execute(
+async def get_user_state(db: AsyncSession, user_id: str, post_ids: list):
+    """The user's vote and saved flag for each of post_ids, in one indexed lookup"""
+    rows = (await db.execute(
         text("""
-            SELECT id, post_id, user_id, content, created_at 
-            FROM comments 
-            WHERE post_id = :post_id 
-            ORDER BY created_at ASC
+            SELECT ids.post_id, COALESCE(v.value, 0), s.post_id IS NOT NULL
+            FROM unnest(CAST(:post_ids AS integer[])) AS ids(post_id)
+            LEFT JOIN votes v ON v.user_id = CAST(:user_id AS uuid) AND v.post_id = ids.post_id
+            LEFT JOIN saves s ON s.user_id = CAST(:user_id AS uuid) AND s.post_id = ids.post_id
         """),
-        {"post_id": post_id}
-    ).fetchall()
+        {"user_id": user_id, "post_ids": post_ids}
+    )).fetchall()
     
     return [
         {
-            "id": row[0],
-            "post_id": row[1],
-            "user_id": str(row[2]),
-            "content": row[3],
-            "created_at": row[4]
+            "post_id": row[0],
+            "user_vote": row[1],
+            "saved": row[2]
         }
-        for row in comments
+        for row in rows
     ]
 
-def create_comment(db: Session, user_id: str, post_id: int, content: str):
-    """Create a comment on a post"""
+def _row_to_comment(row) -> dict:
+    return {
+        "id": row[0],
+        "post_id": row[1],
+        "user_id": str(row[2]),
+        "content": row[3],
+        "created_at": row[4]
+    }
+
+async def get_comments(
+    db: AsyncSession,
+    post_id: int,
+    cursor: Optional[str] = None,
+    limit: int = 50
+):
+    """Get a page of comments on a post, oldest first, using keyset pagination.
+
+    Pages are read in order from the (post_id, created_at, id) index.
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    where_clause = ""
+    params = {"post_id": post_id, "limit": limit + 1}
+    if cursor:
+        created_at, comment_id = _decode_cursor(cursor, "comments", ["text", "bigint"])
+        try:
+            params["after_created_at"] = datetime.fromisoformat(created_at)
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        params["after_id"] = comment_id
+        where_clause = "AND (created_at, id) > (:after_created_at, :after_id)"
+    
+    rows = (await db.execute(
+        text(f"""
+            SELECT id, post_id, user_id, content, created_at
+            FROM comments
+            WHERE post_id = :post_id {where_clause}
+            ORDER BY created_at, id
+            LIMIT :limit
+        """),
+        params
+    )).fetchall()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor("comments", [last[4].isoformat(), last[0]])
+    return [_row_to_comment(row) for row in rows], next_cursor
+
+async def get_latest_comments(db: AsyncSession, post_id: int, limit: int):
+    """Get the newest limit comments on a post, returned oldest first (a preview of the thread)"""
+    rows = (await db.execute(
+        text("""
+            SELECT id, post_id, user_id, content, created_at
+            FROM comments
+            WHERE post_id = :post_id
+            ORDER BY created_at DESC, id DESC
+            LIMIT :limit
+        """),
+        {"post_id": post_id, "limit": limit}
+    )).fetchall()
+    return [_row_to_comment(row) for row in reversed(rows)]
+
+async def create_comment(db: AsyncSession, user_id: str, post_id: int, content: str):
+    """Create a comment on a post and bump the post's comment_count in the same transaction"""
     # Ensure user exists
-    ensure_user(db, user_id)
+    await ensure_user(db, user_id)
     
-    result = db.execute(
+    result = await db.execute(
         text("""
-            INSERT INTO comments (post_id, user_id, content) 
-            VALUES (:post_id, :user_id, :content) 
-            RETURNING id, post_id, user_id, content, created_at
+            WITH new_comment AS (
+                INSERT INTO comments (post_id, user_id, content) 
+                VALUES (:post_id, :user_id, :content) 
+                RETURNING id, post_id, user_id, content, created_at
+            ),
+            bump AS (
+                UPDATE posts SET comment_count = comment_count + 1
+                WHERE id = :post_id
+            )
+            SELECT id, post_id, user_id, content, created_at FROM new_comment
         """),
         {"post_id": post_id, "user_id": user_id, "content": content}
     )
     row = result.fetchone()
-    db.commit()
+    await db.commit()
     
-    return {
-        "id": row[0],
-        "post_id": row[1],
-        "user_id": str(row[2]),
-        "content": row[3],
-        "created_at": row[4]
-    }
+    return _row_to_comment(row)
+
+async def reconcile_comment_counts(db: AsyncSession, batch_size: int = 1000) -> int:
+    """Rebuild posts.comment_count from the comments table, returning how many posts were fixed.
+
+    Walks posts in id order and commits after every batch, so it can run
+    online without holding row locks on the whole table.
+    """
+    fixed = 0
+    after = 0
+    while True:
+        row = (await db.execute(
+            text("""
+                WITH batch AS (
+                    SELECT id FROM posts WHERE id > :after ORDER BY id LIMIT :batch
+                ),
+                counts AS (
+                    SELECT b.id, (SELECT COUNT(*) FROM comments c WHERE c.post_id = b.id) AS cnt
+                    FROM batch b
+                ),
+                updated AS (
+                    UPDATE posts p
+                    SET comment_count = counts.cnt
+                    FROM counts
+                    WHERE p.id = counts.id AND p.comment_count <> counts.cnt
+                    RETURNING p.id
+                )
+                SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM updated)
+            """),
+            {"after": after, "batch": batch_size}
+        )).fetchone()
+        await db.commit()
+        if row[0] is None:
+            return fixed
+        after = row[0]
+        fixed += row[1]
+
+async def backfill_comment_created_at(db: AsyncSession, batch_size: int = 1000) -> int:
+    """Fill in comments.created_at where it is NULL, then validate the NOT NULL check.
+
+    Walks comments in id-ordered batches, committing after each. A missing
+    timestamp is taken from the comment's post, the earliest it can be.
+    Returns how many comments were filled in.
+    """
+    filled = 0
+    after = 0
+    while True:
+        row = (await db.execute(
+            text("""
+                WITH batch AS (
+                    SELECT id FROM comments WHERE id > :after ORDER BY id LIMIT :batch
+                ),
+                updated AS (
+                    UPDATE comments c
+                    SET created_at = COALESCE((SELECT p.created_at FROM posts p WHERE p.id = c.post_id), now())
+                    FROM batch
+                    WHERE c.id = batch.id AND c.created_at IS NULL
+                    RETURNING c.id
+                )
+                SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM updated)
+            """),
+            {"after": after, "batch": batch_size}
+        )).fetchone()
+        await db.commit()
+        if row[0] is None:
+            break
+        after = row[0]
+        filled += row[1]
+    # Scans comments, but only blocks schema changes, not reads or writes
+    await db.execute(text("ALTER TABLE comments VALIDATE CONSTRAINT comments_created_at_not_null"))
+    await db.commit()
+    return filled
+
+async def backfill_hot_score(db: AsyncSession, batch_size: int = 1000) -> int:
+    """Fill in posts.hot_score where it is missing, in id-ordered batches, returning how many were filled.
+
+    The trigger keeps hot_score current for new writes; this fills it in for
+    rows that predate the column.
+    """
+    filled = 0
+    after = 0
+    while True:
+        row = (await db.execute(
+            text("""
+                WITH batch AS (
+                    SELECT id FROM posts WHERE id > :after ORDER BY id LIMIT :batch
+                ),
+                updated AS (
+                    UPDATE posts p
+                    SET hot_score = p.votes + (p.year - 2010) * 6
+                    FROM batch
+                    WHERE p.id = batch.id AND p.hot_score IS NULL
+                    RETURNING p.id
+                )
+                SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM updated)
+            """),
+            {"after": after, "batch": batch_size}
+        )).fetchone()
+        await db.commit()
+        if row[0] is None:
+            return filled
+        after = row[0]
+        filled += row[1]
+
+async def backfill_search_tsv(db: AsyncSession, batch_size: int = 1000) -> int:
+    """Recompute posts.search_tsv for every post in id-ordered batches, returning how many were updated.
 
+    The triggers keep search_tsv current for new writes; this fills it in for
+    rows that predate them (or a change to posts_search_document).
+    """
+    updated = 0
+    after = 0
+    while True:
+        row = (await db.execute(
+            text("""
+                WITH batch AS (
+                    SELECT id FROM posts WHERE id > :after ORDER BY id LIMIT :batch
+                ),
+                updated AS (
+                    UPDATE posts p
+                    SET search_tsv = posts_search_document(
+                        p.title, p.product, p.category, p.cause, p.severity, p.summary,
+                        (SELECT string_agg(t.name, ' ' ORDER BY t.name)
+                         FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+                         WHERE pt.post_id = p.id)
+                    )
+                    FROM batch
+                    WHERE p.id = batch.id
+                    RETURNING p.id
+                )
+                SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM updated)
+            """),
+            {"after": after, "batch": batch_size}
+        )).fetchone()
+        await db.commit()
+        if row[0] is None:
+            return updated
+        after = row[0]
+        updated += row[1]
@@ -0,0 +1,186 @@
+"""Live vote and comment events for GET /stream
+
+Writers publish compact delta events after they commit: {"type": "vote",
+"post_id", "votes"} and {"type": "comment", "post_id", "comment"}. Each
+stream subscribes to a set of post ids and only receives events for those.
+Events are buffered and delivered every STREAM_FLUSH_MS; votes on the same
+post within one interval are coalesced into a single event carrying the
+latest total, so a burst of votes costs subscribers one message.
+
+STREAM_BACKEND selects how events reach subscribers: "memory" (default,
+only streams served by the same process) or "postgres" (LISTEN/NOTIFY on
+STREAM_CHANNEL, so every worker sees every event). The postgres backend
+holds one dedicated connection per worker, opened with STREAM_DATABASE_URL,
+which must reach Postgres directly rather than PgBouncer in transaction mode.
+"""
+import asyncio
+import json
+import os
+from typing import Iterable, Optional
+import asyncpg
+from sqlalchemy.engine import make_url
+from app.db import DATABASE_URL
+
+STREAM_BACKEND = os.getenv("STREAM_BACKEND", "memory")
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "250"))
+STREAM_CHANNEL = os.getenv("STREAM_CHANNEL", "post_events")
+# LISTEN needs a session-level connection; point this past PgBouncer if DATABASE_URL uses it
+STREAM_DATABASE_URL = os.getenv("STREAM_DATABASE_URL", DATABASE_URL)
+# Events a stream may fall behind by before it is disconnected
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+
+# NOTIFY payloads must be under 8000 bytes
+_NOTIFY_MAX_BYTES = 7900
+
+class Subscription:
+    """One stream's queue of pending events and the post ids it follows"""
+
+    def __init__(self, post_ids: Iterable[int]):
+        self.post_ids = set(post_ids)
+        self.queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        # Set when the stream fell too far behind and events were dropped
+        self.overflowed = False
+
+    def put(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+class EventBroker:
+    """In-process fan-out of post events to subscriptions; the "memory" backend"""
+
+    def __init__(self):
+        self._subscribers = {}  # post id -> set of Subscription
+        self._pending_votes = {}  # post id -> latest total
+        self._pending = []  # other events, in publish order
+        self._flusher = None
+        self._stats = {"published": 0, "delivered": 0, "coalesced": 0, "overflows": 0}
+
+    def subscribe(self, post_ids: Iterable[int]) -> Subscription:
+        subscription = Subscription(post_ids)
+        for post_id in subscription.post_ids:
+            self._subscribers.setdefault(post_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for post_id in subscription.post_ids:
+            subscribers = self._subscribers.get(post_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[post_id]
+
+    def publish_vote(self, post_id: int, votes: int):
+        if post_id in self._pending_votes:
+            self._stats["coalesced"] += 1
+        self._pending_votes[post_id] = votes
+        self._stats["published"] += 1
+
+    def publish_comment(self, comment: dict):
+        self._pending.append({
+            "type": "comment",
+            "post_id": comment["post_id"],
+            "comment": dict(comment, created_at=comment["created_at"].isoformat()),
+        })
+        self._stats["published"] += 1
+
+    def deliver(self, event: dict):
+        """Hand an event to the subscriptions following its post"""
+        for subscription in self._subscribers.get(event["post_id"], ()):
+            subscription.put(event)
+            if subscription.overflowed:
+                self._stats["overflows"] += 1
+            else:
+                self._stats["delivered"] += 1
+
+    def _take_pending(self) -> list:
+        events = self._pending
+        events += [
+            {"type": "vote", "post_id": post_id, "votes": votes}
+            for post_id, votes in self._pending_votes.items()
+        ]
+        self._pending = []
+        self._pending_votes = {}
+        return events
+
+    async def _send(self, events: list):
+        for event in events:
+            self.deliver(event)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(STREAM_FLUSH_MS / 1000)
+            events = self._take_pending()
+            if not events:
+                continue
+            try:
+                await self._send(events)
+            except Exception as e:
+                print(f"Error sending stream events: {e}")
+
+    async def start(self):
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+
+    def stats(self) -> dict:
+        return dict(
+            self._stats,
+            backend=STREAM_BACKEND,
+            subscriptions=len({s for subs in self._subscribers.values() for s in subs}),
+            followed_posts=len(self._subscribers),
+        )
+
+class PostgresEventBroker(EventBroker):
+    """Sends events with NOTIFY and delivers what it hears on LISTEN, so
+    subscribers on every worker see writes made by any of them"""
+
+    def __init__(self):
+        super().__init__()
+        self._conn: Optional[asyncpg.Connection] = None
+
+    async def _connect(self):
+        url = make_url(STREAM_DATABASE_URL).set(drivername="postgresql")
+        self._conn = await asyncpg.connect(url.render_as_string(hide_password=False))
+        await self._conn.add_listener(STREAM_CHANNEL, self._on_notify)
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            self.deliver(json.loads(payload))
+        except (ValueError, KeyError) as e:
+            print(f"Ignoring malformed stream event: {e}")
+
+    async def _send(self, events: list):
+        if self._conn is None or self._conn.is_closed():
+            # Reconnect after losing the connection; events heard while it
+            # was down are lost, clients refetch on reconnect
+            await self._connect()
+        for event in events:
+            payload = json.dumps(event, separators=(",", ":"))
+            if len(payload.encode()) > _NOTIFY_MAX_BYTES and event["type"] == "comment":
+                # Too big for NOTIFY: send the event without the body, clients fetch it
+                payload = json.dumps({"type": "comment", "post_id": event["post_id"]})
+            await self._conn.execute("SELECT pg_notify($1, $2)", STREAM_CHANNEL, payload)
+
+    async def start(self):
+        await self._connect()
+        await super().start()
+
+    async def stop(self):
+        await super().stop()
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+def _make_broker() -> EventBroker:
+    if STREAM_BACKEND == "postgres":
+        return PostgresEventBroker()
+    if STREAM_BACKEND != "memory":
+        raise RuntimeError(f"Unknown STREAM_BACKEND {STREAM_BACKEND!r}; use memory or postgres")
+    return EventBroker()
+
+event_broker = _make_broker()
@@ -0,0 +1,97 @@
+"""Bulk import of posts from NDJSON (one post object per line)
+
+Usage:
+    python -m app.importer posts.ndjson [--batch-size 5000]
+    cat posts.ndjson | python -m app.importer -
+
+Each line has the fields of POST /posts plus an optional "votes". Posts are
+written with crud.insert_posts and committed every batch, so a failed import
+keeps the batches before the bad line. POST /posts/bulk streams its request
+body through the same code.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pydantic import ValidationError
+from sqlalchemy import text
+from app.db import JobSessionLocal, job_engine
+from app.crud import insert_posts
+from app.schemas import PostImport
+
+BULK_BATCH_SIZE = 5000
+
+async def ndjson_lines(chunks):
+    """Yield (line number, line) from an async iterator of byte chunks, skipping blank lines"""
+    buffer = b""
+    number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield number, line
+    if buffer.strip():
+        yield number + 1, buffer
+
+async def import_ndjson(db, chunks, batch_size: int = BULK_BATCH_SIZE, on_batch=None) -> tuple:
+    """Insert posts from NDJSON chunks, committing every batch_size posts.
+
+    on_batch, if given, is called with the created posts after each commit.
+    Returns (inserted, batches). Raises ValueError naming the first invalid
+    line; batches committed before it are kept.
+    """
+    inserted = 0
+    batches = 0
+    batch = []
+    async for number, line in ndjson_lines(chunks):
+        try:
+            batch.append(PostImport.model_validate_json(line).model_dump())
+        except ValidationError as e:
+            raise ValueError(f"Line {number}: {e.errors()[0]['msg']} ({inserted} posts imported before it)")
+        if len(batch) >= batch_size:
+            inserted += await _flush(db, batch, on_batch)
+            batches += 1
+            batch = []
+    if batch:
+        inserted += await _flush(db, batch, on_batch)
+        batches += 1
+    return inserted, batches
+
+async def _flush(db, batch: list, on_batch) -> int:
+    # A full batch can outlive DB_STATEMENT_TIMEOUT_MS when sent to POST /posts/bulk
+    await db.execute(text("SET LOCAL statement_timeout = 0"))
+    created = await insert_posts(db, batch)
+    await db.commit()
+    if on_batch is not None:
+        on_batch(created)
+    return len(created)
+
+async def _file_chunks(file, size: int = 1 << 20):
+    while chunk := file.read(size):
+        yield chunk
+
+async def run(args):
+    file = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+    start = time.perf_counter()
+    try:
+        async with JobSessionLocal() as db:
+            inserted, batches = await import_ndjson(db, _file_chunks(file), args.batch_size)
+    except ValueError as e:
+        print(f"Error importing posts: {e}")
+        sys.exit(1)
+    finally:
+        file.close()
+        await job_engine.dispose()
+    elapsed = time.perf_counter() - start
+    print(f"Imported {inserted} posts in {batches} batches in {elapsed:.2f}s ({inserted / elapsed:.0f} posts/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Import posts from an NDJSON file")
+    parser.add_argument("path", help="NDJSON file, or - for stdin")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE, help="posts per transaction")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,36 @@
-from fastapi import FastAPI, Depends, Query, Header, HTTPException
+from fastapi import FastAPI, Depends, Query, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import Optional
-from app.db import get_db, init_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from urllib.parse import urlencode
+import asyncio
+import csv
+import io
+import json
+from app.db import (
+    get_db, read_session, reads_replica, mark_recent_write, SessionLocal,
+    engine, async_engine, replica_engines, REPLICA_STICKY_SECONDS
+)
 from app.schemas import (
-    PostIn, PostOut, PostsResponse, TopCausesResponse,
-    AuthResponse, VoteIn, VoteOut, CommentIn, CommentOut
+    PostIn, PostOut, PostsResponse, TopCausesResponse, BreakdownResponse, SuggestResponse, BulkImportResponse,
+    AuthResponse, VoteIn, VoteOut, CommentIn, CommentOut, CommentsResponse, UserStateResponse
 )
 from app.crud import (
-    get_posts, create_post, get_top_causes,
+    get_posts, create_post, get_top_causes, get_breakdown,
     create_anonymous_user, vote_post, save_post, unsave_post,
-    get_saved_posts, get_comments, create_comment
+    get_saved_posts, get_user_state, get_comments, get_latest_comments, create_comment,
+    stream_posts_export
 )
 from app.models import Post
+from app.migrations import check_schema
+from app.counters import start_vote_folder, stop_vote_folder
+from app.trending import start_trending_rescorer, stop_trending_rescorer
+from app.suggest import suggest_index, build_suggest_index, start_suggest_refresher, stop_suggest_refresher
+from app.importer import import_ndjson
+from app.tag_cache import warm_tag_cache
+from app.cache import response_cache, make_etag, feed_tags
+from app.events import event_broker
 
 app = FastAPI(title="Failure Atlas API")
 
@@ -23,75 +41,315 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Primary-Until"],
 )
 
-# Initialize database tables on startup
+# Check the schema version on startup (migrations run separately, see app.migrations)
 @app.on_event("startup")
 def startup_event():
-    init_db()
+    check_schema()
+    start_vote_folder()
+    start_trending_rescorer()
+    db = SessionLocal()
+    try:
+        warm_tag_cache(db)
+        build_suggest_index(db)
+    finally:
+        db.close()
+    start_suggest_refresher()
+
+@app.on_event("startup")
+async def start_event_broker():
+    await event_broker.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    stop_suggest_refresher()
+    stop_trending_rescorer()
+    stop_vote_folder()
+
+@app.on_event("shutdown")
+async def stop_event_broker():
+    await event_broker.stop()
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics/cache")
+async def cache_metrics():
+    """Hit/miss/invalidation counters of the response cache"""
+    return response_cache.stats()
+
+@app.get("/metrics/pool")
+async def pool_metrics():
+    """Connection pool usage: connections checked out, overflow, checkout waits and timeouts"""
+    return {
+        "requests": async_engine.pool.stats(),
+        "replicas": [replica_engine.pool.stats() for replica_engine in replica_engines],
+        "background": engine.pool.stats(),
+    }
+
+@app.get("/metrics/stream")
+async def stream_metrics():
+    """Live event counters: open streams, followed posts, events published, coalesced and delivered"""
+    return event_broker.stats()
+
 def get_user_id(x_user_id: Optional[str] = Header(None)) -> Optional[str]:
     """Extract user ID from X-User-Id header"""
     return x_user_id
 
+def set_primary_until(response: Response, user_id: str):
+    """Hand the client a token keeping its reads on the primary right after its write"""
+    token = mark_recent_write(user_id)
+    if token:
+        response.headers["X-Primary-Until"] = token
+
+async def get_read_db(
+    user_id: Optional[str] = Depends(get_user_id),
+    x_primary_until: Optional[str] = Header(None)
+):
+    """Session for read-only routes: a replica, or the primary while the
+    X-Primary-Until token from the user's own last write is valid"""
+    async with read_session(user_id, x_primary_until) as db:
+        yield db
+
 @app.post("/auth/anon", response_model=AuthResponse)
-def create_anon_user(db: Session = Depends(get_db)):
+async def create_anon_user(db: AsyncSession = Depends(get_db)):
     """Create an anonymous user"""
-    user_id = create_anonymous_user(db)
+    user_id = await create_anonymous_user(db)
     return AuthResponse(user_id=user_id)
 
+def json_response(request: Request, body: bytes, etag: str) -> Response:
+    """Serve a serialized JSON body with an ETag, or 304 if the client already has it"""
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
 @app.get("/posts", response_model=PostsResponse)
-def list_posts(
+async def list_posts(
+    request: Request,
     q: Optional[str] = Query(None, description="Search query"),
     cause: str = Query("all", description="Filter by cause"),
     severity: str = Query("all", description="Filter by severity"),
-    sort: str = Query("hot", description="Sort by: hot, new, or top"),
-    db: Session = Depends(get_db),
+    sort: str = Query("hot", description="Sort by: hot, new, top, or trending"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+    limit: int = Query(100, ge=1, le=100, description="Page size"),
+    include_total: bool = Query(True, description="Count matching posts (first page only, not with match=prefix)"),
+    match: str = Query("fts", description="Search mode: fts (whole words) or prefix (word prefixes, typo-tolerant)"),
+    view: str = Query("full", description="full, or shared to omit per-user fields (see /me/state)"),
+    db: AsyncSession = Depends(get_read_db),
     user_id: Optional[str] = Depends(get_user_id)
 ):
-    items, total = get_posts(db, q=q, cause=cause, severity=severity, sort=sort, user_id=user_id)
-    return PostsResponse(items=[PostOut(**item) for item in items], total=total)
+    # The shared view is the same page every user sees; the caller merges in
+    # user_vote/saved from /me/state
+    if view == "shared":
+        user_id = None
+    
+    # Anonymous and shared pages only depend on the query string, so they are cached
+    cache_key = None
+    if not user_id:
+        cache_key = "posts?" + urlencode(sorted({
+            "q": (q or "").strip(), "cause": cause.lower(), "severity": severity.lower(),
+            "sort": sort, "cursor": cursor or "", "limit": limit,
+            "include_total": include_total, "match": match
+        }.items()))
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            etag, body = cached.split(b"\n", 1)
+            return json_response(request, body, etag.decode())
+        # Read before the query so a write that commits meanwhile keeps this page out of the cache
+        generation = response_cache.generation()
+    
+    try:
+        items, total, next_cursor = await get_posts(
+            db, q=q, cause=cause, severity=severity, sort=sort,
+            cursor=cursor, limit=limit, user_id=user_id, include_total=include_total,
+            match=match
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response = PostsResponse(items=[PostOut(**item) for item in items], total=total, next_cursor=next_cursor)
+    if cache_key is None:
+        return response
+    
+    body = response.model_dump_json().encode()
+    etag = make_etag(body)
+    tags = ["search"] if q and q.strip() else [f"feed:{cause.lower()}:{severity.lower()}"]
+    tags += [f"post:{item['id']}" for item in items]
+    # A replica may not have caught up with a write invalidated just before
+    # this request, so its pages are only cached once their tags have been
+    # quiet for the replication lag bound
+    quiet_seconds = REPLICA_STICKY_SECONDS if reads_replica(db) else 0
+    response_cache.set(
+        cache_key, etag.encode() + b"\n" + body, tags, since=generation, quiet_seconds=quiet_seconds
+    )
+    return json_response(request, body, etag)
 
 @app.post("/posts", response_model=PostOut)
-def create_new_post(post: PostIn, db: Session = Depends(get_db)):
+async def create_new_post(post: PostIn, db: AsyncSession = Depends(get_db)):
     post_data = post.model_dump()
-    created = create_post(db, post_data)
+    created = await create_post(db, post_data)
+    suggest_index.add_post(created)
+    response_cache.invalidate(feed_tags(created["cause"], created["severity"]))
     return PostOut(**created)
 
+@app.post("/posts/bulk", response_model=BulkImportResponse)
+async def bulk_create_posts(request: Request, db: AsyncSession = Depends(get_db)):
+    """Create posts from an NDJSON request body (one post per line), committed in batches.
+
+    The body is streamed, so archives of any size can be sent in one request.
+    On an invalid line the batches before it stay committed and the 400
+    response says how many posts were imported.
+    """
+    touched = set()
+
+    def on_batch(created: list):
+        suggest_index.add_posts(created)
+        touched.update((post["cause"], post["severity"]) for post in created)
+
+    try:
+        inserted, batches = await import_ndjson(db, request.stream(), on_batch=on_batch)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        for cause, severity in touched:
+            response_cache.invalidate(feed_tags(cause, severity))
+    return BulkImportResponse(inserted=inserted, batches=batches)
+
+EXPORT_FIELDS = [
+    "id", "title", "product", "year", "category", "cause", "severity",
+    "summary", "votes", "comment_count", "created_at", "tags"
+]
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+@app.get("/export/posts")
+async def export_posts(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    q: Optional[str] = Query(None, description="Search query"),
+    cause: str = Query("all", description="Filter by cause"),
+    severity: str = Query("all", description="Filter by severity"),
+    sort: str = Query("hot", description="Sort by: hot, new, top, or trending"),
+    match: str = Query("fts", description="Search mode: fts (whole words) or prefix (word prefixes, typo-tolerant)")
+):
+    """Every post matching the /posts filters, streamed as NDJSON or CSV.
+
+    Rows are read through a server-side cursor and written as they arrive, so
+    exports of any size use constant memory. The stream opens its own read
+    session, which stays open until the last row is sent.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    
+    async def rows():
+        async with read_session() as db:
+            async for post in stream_posts_export(db, q=q, cause=cause, severity=severity, sort=sort, match=match):
+                # created_at has no NOT NULL constraint, so rows may lack one
+                if post["created_at"] is not None:
+                    post["created_at"] = post["created_at"].isoformat()
+                yield post
+    
+    # Rows are buffered into ~64KB chunks rather than sent one write each
+    async def ndjson_body():
+        buffer = io.StringIO()
+        async for post in rows():
+            buffer.write(json.dumps(post) + "\n")
+            if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    async def csv_body():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        async for post in rows():
+            post["tags"] = "|".join(post["tags"])
+            writer.writerow([post[field] for field in EXPORT_FIELDS])
+            if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    if format == "csv":
+        body, media_type = csv_body(), "text/csv"
+    else:
+        body, media_type = ndjson_body(), "application/x-ndjson"
+    return StreamingResponse(
+        body, media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=posts.{format}"}
+    )
+
+@app.get("/suggest", response_model=SuggestResponse)
+async def suggest(
+    prefix: str = Query(..., min_length=1, description="What the user has typed so far"),
+    limit: int = Query(10, ge=1, le=50, description="Number of completions")
+):
+    """Top completions from the in-process prefix index (no database access)"""
+    return SuggestResponse(items=suggest_index.complete(prefix, limit))
+
 @app.get("/analytics/top-causes", response_model=TopCausesResponse)
-def top_causes(db: Session = Depends(get_db)):
+async def top_causes(
+    limit: int = Query(4, ge=1, le=50, description="Number of causes"),
+    db: AsyncSession = Depends(get_read_db)
+):
     from app.schemas import CauseAnalytics
-    items, total = get_top_causes(db, limit=4)
+    items, total = await get_top_causes(db, limit=limit)
     analytics_items = [CauseAnalytics(**item) for item in items]
     return TopCausesResponse(items=analytics_items, total=total)
 
+@app.get("/analytics/breakdown", response_model=BreakdownResponse)
+async def breakdown(
+    by: List[str] = Query(["cause"], description="Dimensions to group by: cause, severity, category, year, tag"),
+    cause: Optional[str] = Query(None, description="Only count this cause"),
+    severity: Optional[str] = Query(None, description="Only count this severity"),
+    category: Optional[str] = Query(None, description="Only count this category"),
+    year: Optional[int] = Query(None, description="Only count this year"),
+    tag: Optional[str] = Query(None, description="Only count posts with this tag"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of groups"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Post counts and vote sums sliced by any combination of dimensions, from precomputed rollups"""
+    filters = {
+        "cause": cause.lower() if cause else None,
+        "severity": severity.lower() if severity else None,
+        "category": category,
+        "year": year,
+        "tag": tag.lower() if tag else None
+    }
+    try:
+        items, total = await get_breakdown(db, by, filters, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return BreakdownResponse(items=items, total=total)
+
 @app.post("/posts/{post_id}/vote", response_model=VoteOut)
-def vote_on_post(
+async def vote_on_post(
     post_id: int,
+    response: Response,
     vote: VoteIn,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: Optional[str] = Depends(get_user_id)
 ):
     """Vote on a post. Requires X-User-Id header."""
     if not user_id:
         raise HTTPException(status_code=401, detail="X-User-Id header required")
     
-    # Validate post exists
-    post = db.query(Post).filter(Post.id == post_id).first()
-    if not post:
+    result = await vote_post(db, user_id, post_id, vote.value)
+    if result is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    
-    result = vote_post(db, user_id, post_id, vote.value)
+    set_primary_until(response, user_id)
+    response_cache.invalidate([f"post:{post_id}"])
+    event_broker.publish_vote(post_id, result["votes"])
     return VoteOut(**result)
 
 @app.post("/posts/{post_id}/save")
-def save_post_endpoint(
+async def save_post_endpoint(
     post_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     user_id: Optional[str] = Depends(get_user_id)
 ):
     """Save a post. Requires X-User-Id header."""
@@ -99,54 +357,89 @@ def save_post_endpoint(
         raise HTTPException(status_code=401, detail="X-User-Id header required")
     
     # Validate post exists
-    post = db.query(Post).filter(Post.id == post_id).first()
+    post = await db.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    save_post(db, user_id, post_id)
+    await save_post(db, user_id, post_id)
+    set_primary_until(response, user_id)
     return {"status": "saved", "post_id": post_id}
 
 @app.delete("/posts/{post_id}/save")
-def unsave_post_endpoint(
+async def unsave_post_endpoint(
     post_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     user_id: Optional[str] = Depends(get_user_id)
 ):
     """Unsave a post. Requires X-User-Id header."""
     if not user_id:
         raise HTTPException(status_code=401, detail="X-User-Id header required")
     
-    unsave_post(db, user_id, post_id)
+    await unsave_post(db, user_id, post_id)
+    set_primary_until(response, user_id)
     return {"status": "unsaved", "post_id": post_id}
 
 @app.get("/me/saved", response_model=PostsResponse)
-def get_my_saved_posts(
-    db: Session = Depends(get_db),
+async def get_my_saved_posts(
+    db: AsyncSession = Depends(get_read_db),
     user_id: Optional[str] = Depends(get_user_id)
 ):
     """Get saved posts for the current user. Requires X-User-Id header."""
     if not user_id:
         raise HTTPException(status_code=401, detail="X-User-Id header required")
     
-    items, total = get_saved_posts(db, user_id)
+    items, total = await get_saved_posts(db, user_id)
     return PostsResponse(items=[PostOut(**item) for item in items], total=total)
 
-@app.get("/posts/{post_id}/comments", response_model=dict)
-def list_comments(post_id: int, db: Session = Depends(get_db)):
-    """Get comments for a post"""
+@app.get("/me/state", response_model=UserStateResponse)
+async def get_my_state(
+    post_ids: str = Query(..., description="Comma-separated post IDs (at most 100)"),
+    db: AsyncSession = Depends(get_read_db),
+    user_id: Optional[str] = Depends(get_user_id)
+):
+    """Per-user overlay for a shared page: the user's vote and saved flag for each post. Requires X-User-Id header."""
+    if not user_id:
+        raise HTTPException(status_code=401, detail="X-User-Id header required")
+    
+    try:
+        ids = [int(post_id) for post_id in post_ids.split(",") if post_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="post_ids must be comma-separated integers")
+    if len(ids) > 100:
+        raise HTTPException(status_code=400, detail="At most 100 post_ids")
+    
+    return UserStateResponse(items=await get_user_state(db, user_id, ids))
+
+@app.get("/posts/{post_id}/comments", response_model=CommentsResponse)
+async def list_comments(
+    post_id: int,
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+    limit: int = Query(50, ge=1, le=200, description="Page size"),
+    latest: Optional[int] = Query(None, ge=1, le=50, description="Only the newest N comments (a preview), oldest first"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get a page of comments for a post, oldest first, or the latest N"""
     # Validate post exists
-    post = db.query(Post).filter(Post.id == post_id).first()
+    post = await db.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    comments = get_comments(db, post_id)
-    return {"items": [CommentOut(**comment) for comment in comments]}
+    if latest is not None:
+        comments = await get_latest_comments(db, post_id, latest)
+        return CommentsResponse(items=[CommentOut(**comment) for comment in comments])
+    try:
+        comments, next_cursor = await get_comments(db, post_id, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return CommentsResponse(items=[CommentOut(**comment) for comment in comments], next_cursor=next_cursor)
 
 @app.post("/posts/{post_id}/comments", response_model=CommentOut)
-def create_comment_endpoint(
+async def create_comment_endpoint(
     post_id: int,
+    response: Response,
     comment: CommentIn,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: Optional[str] = Depends(get_user_id)
 ):
     """Create a comment on a post. Requires X-User-Id header."""
@@ -154,10 +447,57 @@ def create_comment_endpoint(
         raise HTTPException(status_code=401, detail="X-User-Id header required")
     
     # Validate post exists
-    post = db.query(Post).filter(Post.id == post_id).first()
+    post = await db.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    created = create_comment(db, user_id, post_id, comment.content)
+    created = await create_comment(db, user_id, post_id, comment.content)
+    set_primary_until(response, user_id)
+    response_cache.invalidate([f"post:{post_id}"])
+    event_broker.publish_comment(created)
     return CommentOut(**created)
 
+
+STREAM_MAX_POSTS = 200
+STREAM_HEARTBEAT_SECONDS = 15
+
+@app.get("/stream")
+async def stream_events(
+    request: Request,
+    post: List[int] = Query(..., description="Post ids to follow (repeat the parameter, at most 200)")
+):
+    """Server-sent events for votes and comments on the followed posts.
+
+    Each event is one "vote" or "comment" message whose data is the JSON
+    delta. To follow other posts, open a new stream. If the client falls too
+    far behind, the stream sends "overflow" and closes; the client should
+    reconnect and refetch what it shows.
+    """
+    if len(post) > STREAM_MAX_POSTS:
+        raise HTTPException(status_code=400, detail=f"At most {STREAM_MAX_POSTS} posts per stream")
+    
+    async def events():
+        subscription = event_broker.subscribe(post)
+        try:
+            # Tell the client how long to wait before reconnecting
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+                if subscription.overflowed:
+                    yield "event: overflow\ndata: {}\n\n"
+                    break
+        finally:
+            event_broker.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,114 @@
+"""Maintenance commands for repairing denormalized data
+
+Usage:
+    python -m app.maintenance reconcile-comment-counts [--batch-size 1000]
+    python -m app.maintenance backfill-search-tsv [--batch-size 1000]
+    python -m app.maintenance backfill-hot-score [--batch-size 1000]
+    python -m app.maintenance backfill-comment-created-at [--batch-size 1000]
+    python -m app.maintenance rebuild-cause-stats
+    python -m app.maintenance rebuild-rollups
+
+The per-row jobs (reconcile-comment-counts, backfill-search-tsv,
+backfill-hot-score, backfill-comment-created-at) commit after every batch, so they can run
+against a live database. So can rebuild-cause-stats and rebuild-rollups,
+since writers only append deltas to the tables they rebuild.
+"""
+import argparse
+import asyncio
+import sys
+from app.db import JobSessionLocal, job_engine
+from app.crud import (
+    reconcile_comment_counts, backfill_search_tsv, backfill_hot_score, backfill_comment_created_at,
+    rebuild_cause_stats, rebuild_rollups
+)
+
+async def run_reconcile_comment_counts(args):
+    """Rebuild posts.comment_count from the comments table"""
+    async with JobSessionLocal() as db:
+        try:
+            fixed = await reconcile_comment_counts(db, args.batch_size)
+            print(f"Reconciled comment counts ({fixed} posts fixed)")
+        except Exception as e:
+            await db.rollback()
+            print(f"Error reconciling comment counts: {e}")
+            sys.exit(1)
+
+async def run_backfill_search_tsv(args):
+    """Recompute posts.search_tsv for every post"""
+    async with JobSessionLocal() as db:
+        try:
+            updated = await backfill_search_tsv(db, args.batch_size)
+            print(f"Backfilled search_tsv ({updated} posts)")
+        except Exception as e:
+            await db.rollback()
+            print(f"Error backfilling search_tsv: {e}")
+            sys.exit(1)
+
+async def run_backfill_hot_score(args):
+    """Fill in posts.hot_score for posts that predate the column"""
+    async with JobSessionLocal() as db:
+        try:
+            filled = await backfill_hot_score(db, args.batch_size)
+            print(f"Backfilled hot scores ({filled} posts)")
+        except Exception as e:
+            await db.rollback()
+            print(f"Error backfilling hot scores: {e}")
+            sys.exit(1)
+
+async def run_backfill_comment_created_at(args):
+    """Fill in missing comments.created_at and validate the NOT NULL check"""
+    async with JobSessionLocal() as db:
+        try:
+            filled = await backfill_comment_created_at(db, args.batch_size)
+            print(f"Backfilled comment timestamps ({filled} comments)")
+        except Exception as e:
+            await db.rollback()
+            print(f"Error backfilling comment timestamps: {e}")
+            sys.exit(1)
+
+async def run_rebuild_cause_stats(args):
+    """Recompute cause_stats from posts"""
+    async with JobSessionLocal() as db:
+        try:
+            causes = await rebuild_cause_stats(db)
+            print(f"Rebuilt cause stats ({causes} causes)")
+        except Exception as e:
+            await db.rollback()
+            print(f"Error rebuilding cause stats: {e}")
+            sys.exit(1)
+
+async def run_rebuild_rollups(args):
+    """Recompute the analytics rollups from posts"""
+    async with JobSessionLocal() as db:
+        try:
+            cells = await rebuild_rollups(db)
+            print(f"Rebuilt analytics rollups ({cells} cells)")
+        except Exception as e:
+            await db.rollback()
+            print(f"Error rebuilding analytics rollups: {e}")
+            sys.exit(1)
+
+COMMANDS = {
+    "reconcile-comment-counts": run_reconcile_comment_counts,
+    "backfill-search-tsv": run_backfill_search_tsv,
+    "backfill-hot-score": run_backfill_hot_score,
+    "backfill-comment-created-at": run_backfill_comment_created_at,
+    "rebuild-cause-stats": run_rebuild_cause_stats,
+    "rebuild-rollups": run_rebuild_rollups,
+}
+
+async def run(command, args):
+    try:
+        await command(args)
+    finally:
+        await job_engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description="Failure Atlas maintenance commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per transaction for per-row jobs")
+    args = parser.parse_args()
+    asyncio.run(run(COMMANDS[args.command], args))
+
+if __name__ == "__main__":
+    main()
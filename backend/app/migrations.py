@@ -0,0 +1,583 @@
+"""Versioned schema migrations
+
+Usage:
+    python -m app.migrations [upgrade]  apply pending migrations
+    python -m app.migrations status     show the current and latest version
+
+Each migration runs in its own transaction together with the row recording
+it in schema_migrations, under an advisory lock so concurrent runs (e.g.
+several workers with AUTO_MIGRATE=true) apply each migration once. Waiting
+runs poll for the lock rather than block on it (see _acquire_migrate_lock).
+Every index is built CONCURRENTLY, outside that transaction (see
+_create_index_concurrently), and no migration rewrites a table. All DDL is idempotent, so databases created by
+the old startup-time setup, or a migration interrupted after an index build,
+upgrade cleanly.
+
+Migrations only change the schema. Rewriting existing rows is left to the
+batched maintenance jobs (python -m app.maintenance ...); a migration that
+leaves rows to fill in returns the jobs to run, and they are printed after
+migrating.
+
+Worker startup only checks the version (check_schema): one query, no DDL.
+"""
+import argparse
+import os
+import sys
+import time
+from sqlalchemy import exc, text
+from app.db import engine
+
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "false").lower() == "true"
+
+# Advisory lock key so only one process migrates at a time
+MIGRATE_LOCK_ID = 7_420_003
+# How often a process waiting for another's migration retries the lock
+MIGRATE_LOCK_POLL_SECONDS = 0.5
+
+def _initial_schema(conn) -> list:
+    # Remove old embedding infrastructure
+    conn.execute(text("DROP INDEX IF EXISTS posts_embedding_hnsw"))
+    conn.execute(text("ALTER TABLE IF EXISTS posts DROP COLUMN IF EXISTS embedding"))
+
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS posts (
+            id SERIAL PRIMARY KEY,
+            votes INTEGER NOT NULL DEFAULT 0,
+            title TEXT NOT NULL,
+            product TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            cause TEXT NOT NULL,
+            severity VARCHAR(10) NOT NULL,
+            summary TEXT NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT now()
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS tags (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS post_tags (
+            post_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
+            tag_id INTEGER REFERENCES tags(id) ON DELETE CASCADE,
+            PRIMARY KEY (post_id, tag_id)
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS users (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            created_at TIMESTAMPTZ DEFAULT now()
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS votes (
+            user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+            post_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
+            value SMALLINT NOT NULL CHECK (value IN (-1, 1)),
+            created_at TIMESTAMPTZ DEFAULT now(),
+            PRIMARY KEY (user_id, post_id)
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS saves (
+            user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+            post_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
+            created_at TIMESTAMPTZ DEFAULT now(),
+            PRIMARY KEY (user_id, post_id)
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS comments (
+            id BIGSERIAL PRIMARY KEY,
+            post_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
+            user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+            content TEXT NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT now()
+        )
+    """))
+    _create_index_concurrently(conn, "idx_votes_post_id", "votes(post_id)")
+    _create_index_concurrently(conn, "idx_votes_created_at", "votes(created_at)")
+    _create_index_concurrently(conn, "idx_saves_user_id", "saves(user_id)")
+    _create_index_concurrently(conn, "idx_comments_post_id", "comments(post_id)")
+    return []
+
+def _search(conn) -> list:
+    conn.execute(text("ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_tsv tsvector"))
+
+    # Databases from before the weighted document hold unweighted vectors in
+    # every row, which all need recomputing once the function is installed
+    reweight = conn.execute(text("""
+        SELECT to_regprocedure('posts_search_document(text, text, text, text, text, text, text)') IS NULL
+    """)).scalar()
+
+    # Weighted search document: title/product (A), tags/cause/category (B),
+    # summary/severity (C)
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION posts_search_document(
+            title TEXT, product TEXT, category TEXT, cause TEXT,
+            severity TEXT, summary TEXT, tags TEXT
+        ) RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+            SELECT
+                setweight(to_tsvector('english', coalesce(title, '') || ' ' || coalesce(product, '')), 'A') ||
+                setweight(to_tsvector('english',
+                    coalesce(tags, '') || ' ' || coalesce(cause, '') || ' ' || coalesce(category, '')), 'B') ||
+                setweight(to_tsvector('english', coalesce(summary, '') || ' ' || coalesce(severity, '')), 'C')
+        $$
+    """))
+
+    # Row trigger on posts: recompute when any searchable column changes
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION posts_search_tsv_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.search_tsv := posts_search_document(
+                NEW.title, NEW.product, NEW.category, NEW.cause, NEW.severity, NEW.summary,
+                (SELECT string_agg(t.name, ' ')
+                 FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+                 WHERE pt.post_id = NEW.id)
+            );
+            RETURN NEW;
+        END
+        $$
+    """))
+    conn.execute(text("DROP TRIGGER IF EXISTS posts_search_tsv_update ON posts"))
+    conn.execute(text("""
+        CREATE TRIGGER posts_search_tsv_update
+        BEFORE INSERT OR UPDATE OF title, product, category, cause, severity, summary ON posts
+        FOR EACH ROW EXECUTE FUNCTION posts_search_tsv_trigger()
+    """))
+
+    # Statement triggers on post_tags: one UPDATE per statement for all
+    # posts whose tags changed
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION post_tags_search_tsv_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE posts p
+            SET search_tsv = posts_search_document(
+                p.title, p.product, p.category, p.cause, p.severity, p.summary,
+                (SELECT string_agg(t.name, ' ')
+                 FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+                 WHERE pt.post_id = p.id)
+            )
+            WHERE p.id IN (SELECT DISTINCT post_id FROM changed_tags);
+            RETURN NULL;
+        END
+        $$
+    """))
+    conn.execute(text("DROP TRIGGER IF EXISTS post_tags_search_tsv_insert ON post_tags"))
+    conn.execute(text("""
+        CREATE TRIGGER post_tags_search_tsv_insert
+        AFTER INSERT ON post_tags
+        REFERENCING NEW TABLE AS changed_tags
+        FOR EACH STATEMENT EXECUTE FUNCTION post_tags_search_tsv_trigger()
+    """))
+    conn.execute(text("DROP TRIGGER IF EXISTS post_tags_search_tsv_delete ON post_tags"))
+    conn.execute(text("""
+        CREATE TRIGGER post_tags_search_tsv_delete
+        AFTER DELETE ON post_tags
+        REFERENCING OLD TABLE AS changed_tags
+        FOR EACH STATEMENT EXECUTE FUNCTION post_tags_search_tsv_trigger()
+    """))
+
+    # Trigram indexes for prefix / typo-tolerant search
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    _create_index_concurrently(conn, "posts_search_tsv_gin", "posts USING gin(search_tsv)")
+    _create_index_concurrently(conn, "posts_title_trgm", "posts USING gin(title gin_trgm_ops)")
+    _create_index_concurrently(conn, "posts_product_trgm", "posts USING gin(product gin_trgm_ops)")
+    _create_index_concurrently(conn, "tags_name_trgm", "tags USING gin(name gin_trgm_ops)")
+
+    stale = "true" if reweight else "search_tsv IS NULL"
+    if conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM posts WHERE {stale})")).scalar():
+        return ["backfill-search-tsv"]
+    return []
+
+def _counters(conn) -> list:
+    backfills = []
+
+    # Denormalized comment counter, maintained by create_comment
+    added = conn.execute(text("""
+        SELECT NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'posts' AND column_name = 'comment_count'
+        )
+    """)).scalar()
+    conn.execute(text("ALTER TABLE posts ADD COLUMN IF NOT EXISTS comment_count INTEGER NOT NULL DEFAULT 0"))
+    if added and conn.execute(text("SELECT EXISTS (SELECT 1 FROM comments)")).scalar():
+        backfills.append("reconcile-comment-counts")
+
+    # Vote counter shards (used when VOTE_COUNTER_MODE=sharded)
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS post_vote_shards (
+            post_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
+            shard SMALLINT NOT NULL,
+            delta INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (post_id, shard)
+        )
+    """))
+
+    # Per-cause post counters and analytics rollups (cause x severity x
+    # category x year, and per tag)
+    created = conn.execute(text("SELECT to_regclass('cause_stats') IS NULL")).scalar()
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS cause_stats (
+            cause TEXT PRIMARY KEY,
+            post_count INTEGER NOT NULL DEFAULT 0
+        )
+    """))
+    if created and conn.execute(text("SELECT EXISTS (SELECT 1 FROM posts)")).scalar():
+        backfills.append("rebuild-cause-stats")
+
+    created = conn.execute(text("SELECT to_regclass('post_rollups') IS NULL")).scalar()
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS post_rollups (
+            cause TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            category TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            post_count INTEGER NOT NULL DEFAULT 0,
+            vote_sum BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (cause, severity, category, year)
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS tag_rollups (
+            tag TEXT NOT NULL,
+            cause TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            category TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            post_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (tag, cause, severity, category, year)
+        )
+    """))
+    if created and conn.execute(text("SELECT EXISTS (SELECT 1 FROM posts)")).scalar():
+        backfills.append("rebuild-rollups")
+    return backfills
+
+def _hot_score_trigger(conn):
+    # Row trigger keeping hot_score = votes + (year - 2010) * 6 on every write
+    # path (votes, shard folds, imports)
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION posts_hot_score_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.hot_score := NEW.votes + (NEW.year - 2010) * 6;
+            RETURN NEW;
+        END
+        $$
+    """))
+    conn.execute(text("DROP TRIGGER IF EXISTS posts_hot_score_update ON posts"))
+    conn.execute(text("""
+        CREATE TRIGGER posts_hot_score_update
+        BEFORE INSERT OR UPDATE OF votes, year ON posts
+        FOR EACH ROW EXECUTE FUNCTION posts_hot_score_trigger()
+    """))
+
+def _feed_sorts(conn) -> list:
+    # Stored hot score for the default feed sort. A plain column (a generated
+    # one would rewrite the table under an exclusive lock); existing rows are
+    # filled in by backfill-hot-score
+    conn.execute(text("ALTER TABLE posts ADD COLUMN IF NOT EXISTS hot_score INTEGER"))
+    _hot_score_trigger(conn)
+    backfills = []
+    if conn.execute(text("SELECT EXISTS (SELECT 1 FROM posts WHERE hot_score IS NULL)")).scalar():
+        backfills.append("backfill-hot-score")
+
+    # Time-decayed trending score, re-scored by app.trending
+    conn.execute(text("""
+        ALTER TABLE posts
+        ADD COLUMN IF NOT EXISTS trend_score DOUBLE PRECISION NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS scored_votes INTEGER
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS job_runs (
+            name TEXT PRIMARY KEY,
+            last_run_at TIMESTAMPTZ NOT NULL
+        )
+    """))
+    # Only posts whose votes moved since the last pass are in this index
+    _create_index_concurrently(
+        conn, "idx_posts_trend_dirty", "posts(id) WHERE votes IS DISTINCT FROM scored_votes"
+    )
+
+    # Feed indexes: one per filter combination and sort, ending in id so
+    # keyset pages are read in index order with no sort step
+    for sort_column in ("hot_score", "votes", "year", "trend_score"):
+        for filter_columns in ((), ("cause",), ("severity",), ("cause", "severity")):
+            columns = filter_columns + (sort_column, "id")
+            _create_index_concurrently(conn, f"idx_posts_{'_'.join(columns)}", f"posts({', '.join(columns)})")
+    return backfills
+
+def _create_index_concurrently(conn, name: str, definition: str):
+    """Build an index without blocking writes to the table.
+
+    CREATE INDEX CONCURRENTLY can't run inside a transaction, so conn's work so
+    far is committed and the index is built on an autocommit connection. An
+    invalid index left by an interrupted build is dropped and rebuilt.
+    """
+    conn.commit()
+    with engine.connect() as autocommit:
+        autocommit = autocommit.execution_options(isolation_level="AUTOCOMMIT")
+        invalid = autocommit.execute(
+            text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+            {"name": name}
+        ).scalar()
+        if invalid:
+            autocommit.execute(text(f"DROP INDEX CONCURRENTLY {name}"))
+        autocommit.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}"))
+
+def _drop_index_concurrently(conn, name: str):
+    """Drop an index without blocking the table, committing conn's work first"""
+    conn.commit()
+    with engine.connect() as autocommit:
+        autocommit = autocommit.execution_options(isolation_level="AUTOCOMMIT")
+        autocommit.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+def _comment_pages(conn) -> list:
+    # Comment pages are keyset-paginated on (created_at, id) within a post, so
+    # created_at must not be NULL. The constraint is added NOT VALID (no scan);
+    # backfill-comment-created-at fills old NULLs and then validates it.
+    constraint = conn.execute(text("""
+        SELECT convalidated FROM pg_constraint
+        WHERE conrelid = 'comments'::regclass AND conname = 'comments_created_at_not_null'
+    """)).fetchone()
+    if constraint is None:
+        conn.execute(text("""
+            ALTER TABLE comments ADD CONSTRAINT comments_created_at_not_null
+            CHECK (created_at IS NOT NULL) NOT VALID
+        """))
+    backfills = []
+    if constraint is None or not constraint[0]:
+        if conn.execute(text("SELECT EXISTS (SELECT 1 FROM comments)")).scalar():
+            backfills.append("backfill-comment-created-at")
+        else:
+            conn.execute(text("ALTER TABLE comments VALIDATE CONSTRAINT comments_created_at_not_null"))
+
+    _create_index_concurrently(conn, "idx_comments_post_id_created_at_id", "comments(post_id, created_at, id)")
+    # Covered by the index above
+    conn.execute(text("DROP INDEX IF EXISTS idx_comments_post_id"))
+    return backfills
+
+def _rollup_deltas(conn) -> list:
+    # Append-only changes to the analytics rollups, applied by the counter
+    # folder, so writers never update (and queue on) a shared rollup row
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS post_rollup_deltas (
+            cause TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            category TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            post_count INTEGER NOT NULL DEFAULT 0,
+            vote_sum BIGINT NOT NULL DEFAULT 0
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS tag_rollup_deltas (
+            tag TEXT NOT NULL,
+            cause TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            category TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            post_count INTEGER NOT NULL DEFAULT 0
+        )
+    """))
+    return []
+
+def _search_document_once(conn) -> list:
+    # insert_posts writes each post's full document (tags included) in its
+    # INSERT. The row trigger keeps a document supplied on INSERT instead of
+    # computing one without tags, and the post_tags trigger only rewrites
+    # posts whose document actually changed, so an imported post is written
+    # once. Tags are concatenated in name order everywhere, so documents built
+    # by different paths compare equal.
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION posts_search_tsv_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                -- A new post has no post_tags rows yet
+                IF NEW.search_tsv IS NULL THEN
+                    NEW.search_tsv := posts_search_document(
+                        NEW.title, NEW.product, NEW.category, NEW.cause, NEW.severity, NEW.summary, NULL
+                    );
+                END IF;
+                RETURN NEW;
+            END IF;
+            NEW.search_tsv := posts_search_document(
+                NEW.title, NEW.product, NEW.category, NEW.cause, NEW.severity, NEW.summary,
+                (SELECT string_agg(t.name, ' ' ORDER BY t.name)
+                 FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+                 WHERE pt.post_id = NEW.id)
+            );
+            RETURN NEW;
+        END
+        $$
+    """))
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION post_tags_search_tsv_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE posts p
+            SET search_tsv = d.document
+            FROM (
+                SELECT posts.id, posts_search_document(
+                    posts.title, posts.product, posts.category, posts.cause, posts.severity, posts.summary,
+                    (SELECT string_agg(t.name, ' ' ORDER BY t.name)
+                     FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+                     WHERE pt.post_id = posts.id)
+                ) AS document
+                FROM posts
+                WHERE posts.id IN (SELECT DISTINCT post_id FROM changed_tags)
+            ) d
+            WHERE p.id = d.id AND p.search_tsv IS DISTINCT FROM d.document;
+            RETURN NULL;
+        END
+        $$
+    """))
+    return []
+
+def _plain_hot_score(conn) -> list:
+    # Databases migrated while feed_sorts still added hot_score as a generated
+    # column: turn it into the trigger-maintained plain column. DROP
+    # EXPRESSION keeps the stored values and does not rewrite the table
+    generated = conn.execute(text("""
+        SELECT attgenerated = 's' FROM pg_attribute
+        WHERE attrelid = 'posts'::regclass AND attname = 'hot_score'
+    """)).scalar()
+    if generated:
+        conn.execute(text("ALTER TABLE posts ALTER COLUMN hot_score DROP EXPRESSION"))
+        _hot_score_trigger(conn)
+    return []
+
+def _prefix_knn(conn) -> list:
+    # Prefix search takes the closest trigram matches per source with
+    # ORDER BY <<-> LIMIT, which needs GiST indexes (GIN can't order); GiST
+    # also serves the <% filter, so the GIN trigram indexes go
+    _create_index_concurrently(conn, "posts_title_trgm_gist", "posts USING gist(title gist_trgm_ops)")
+    _create_index_concurrently(conn, "posts_product_trgm_gist", "posts USING gist(product gist_trgm_ops)")
+    _create_index_concurrently(conn, "tags_name_trgm_gist", "tags USING gist(name gist_trgm_ops)")
+    for name in ("posts_title_trgm", "posts_product_trgm", "tags_name_trgm"):
+        _drop_index_concurrently(conn, name)
+    # A matched tag's newest posts, read in index order
+    _create_index_concurrently(conn, "idx_post_tags_tag_id_post_id", "post_tags(tag_id, post_id)")
+    return []
+
+def _cause_stats_deltas(conn) -> list:
+    # New posts append their cause counts here for the counter folder, like
+    # the rollup deltas, instead of upserting the shared cause_stats row
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS cause_stats_deltas (
+            cause TEXT NOT NULL,
+            post_count INTEGER NOT NULL DEFAULT 0
+        )
+    """))
+    return []
+
+# (version, name, migration) in order; never edit a released migration, add a new one
+MIGRATIONS = [
+    (1, "initial_schema", _initial_schema),
+    (2, "search", _search),
+    (3, "counters", _counters),
+    (4, "feed_sorts", _feed_sorts),
+    (5, "comment_pages", _comment_pages),
+    (6, "rollup_deltas", _rollup_deltas),
+    (7, "search_document_once", _search_document_once),
+    (8, "plain_hot_score", _plain_hot_score),
+    (9, "prefix_knn", _prefix_knn),
+    (10, "cause_stats_deltas", _cause_stats_deltas),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def current_version(conn) -> int:
+    """The highest applied migration, or 0 for a database that has never been migrated"""
+    try:
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+    except exc.ProgrammingError:
+        conn.rollback()
+        return 0
+
+def _acquire_migrate_lock(conn):
+    """Take the session-level migrate lock, polling between attempts.
+
+    A process blocked in pg_advisory_lock holds a snapshot for as long as it
+    waits, and CREATE INDEX CONCURRENTLY in the process holding the lock waits
+    for every older snapshot to go away, so several workers migrating at once
+    would deadlock without Postgres noticing. Waiters instead retry
+    pg_try_advisory_lock with no transaction open in between.
+    """
+    while True:
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": MIGRATE_LOCK_ID}).scalar()
+        conn.commit()
+        if acquired:
+            return
+        time.sleep(MIGRATE_LOCK_POLL_SECONDS)
+
+def migrate() -> int:
+    """Apply pending migrations, returning the resulting schema version"""
+    with engine.connect() as conn:
+        _acquire_migrate_lock(conn)
+        try:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """))
+            conn.commit()
+
+            backfills = []
+            version = current_version(conn)
+            for number, name, migration in MIGRATIONS:
+                if number <= version:
+                    continue
+                backfills += migration(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                    {"version": number, "name": name}
+                )
+                conn.commit()
+                print(f"Applied migration {number} ({name})")
+                version = number
+
+            for command in backfills:
+                print(f"Existing rows need a backfill: python -m app.maintenance {command}")
+            return version
+        finally:
+            # Discard a failed migration before releasing the session-level lock
+            conn.rollback()
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATE_LOCK_ID})
+            conn.commit()
+
+def check_schema():
+    """Worker startup check: the schema must be at LATEST_VERSION (migrating first with AUTO_MIGRATE=true)"""
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version >= LATEST_VERSION:
+        return
+    if AUTO_MIGRATE:
+        migrate()
+        return
+    raise RuntimeError(
+        f"Database schema is at version {version}, this build needs {LATEST_VERSION}. "
+        "Run python -m app.migrations (or set AUTO_MIGRATE=true)."
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Failure Atlas schema migrations")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status"])
+    args = parser.parse_args()
+    if args.command == "status":
+        with engine.connect() as conn:
+            version = current_version(conn)
+        print(f"Schema version {version} (latest {LATEST_VERSION})")
+        return
+    try:
+        version = migrate()
+    except Exception as e:
+        print(f"Error migrating database: {e}")
+        sys.exit(1)
+    print(f"Schema is at version {version}")
+
+if __name__ == "__main__":
+    main()
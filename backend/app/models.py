@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Table
+from sqlalchemy import Column, Float, Integer, String, Text, DateTime, ForeignKey, Table
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db import Base
@@ -24,6 +24,10 @@ class Post(Base):
     severity = Column(String(10), nullable=False)  # 'low', 'med', 'high'
     summary = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")  # maintained by create_comment
+    hot_score = Column(Integer)  # default feed sort, votes + (year - 2010) * 6, kept by a trigger
+    trend_score = Column(Float, nullable=False, default=0, server_default="0")  # maintained by app.trending
+    scored_votes = Column(Integer)  # votes when trend_score was last computed
     # search_tsv is added via migration, not defined here to avoid SQLAlchemy type issues
     # We use raw SQL for Full-Text Search operations
 
@@ -0,0 +1,119 @@
+"""Connection pool settings and checkout metrics
+
+Pool sizing comes from the environment so it can be tuned per deployment:
+
+    DB_POOL_SIZE            connections kept open per process (default 5)
+    DB_MAX_OVERFLOW         extra connections opened under load (default 10)
+    DB_POOL_TIMEOUT         seconds to wait for a connection before failing (default 30)
+    DB_POOL_RECYCLE         seconds before a connection is replaced, -1 never (default 1800)
+    DB_POOL_PRE_PING        "true" to test connections on checkout (default false)
+    DB_STATEMENT_TIMEOUT_MS per-statement timeout for request queries, 0 none (default 0);
+                            command-line jobs are not subject to it
+    DB_PGBOUNCER            "true" when DATABASE_URL points at PgBouncer in
+                            transaction mode (default false)
+
+Behind PgBouncer the app keeps no pool of its own (PgBouncer is the pool) and
+asyncpg's prepared statement caches are turned off, since consecutive
+transactions may land on different server connections.
+
+The pools record how long each checkout waited, how many timed out and how
+many connections are in use; /metrics/pool reports them.
+"""
+import os
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+class _TimedCheckout:
+    """Pool mixin counting checkouts, their wait time, timeouts and connections in use"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats = {"checkouts": 0, "timeouts": 0, "in_use": 0, "wait_total": 0.0, "wait_max": 0.0}
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self._stats["timeouts"] += 1
+            raise
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+            self._stats["wait_total"] += waited
+            self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+        return conn
+
+    def _do_return_conn(self, record):
+        with self._stats_lock:
+            self._stats["in_use"] -= 1
+        super()._do_return_conn(record)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        checkouts = stats["checkouts"]
+        result = {
+            "pool": type(self).__name__,
+            "checked_out": stats["in_use"],
+            "checkouts": checkouts,
+            "timeouts": stats["timeouts"],
+            "wait_ms_avg": round(stats["wait_total"] / checkouts * 1000, 3) if checkouts else 0.0,
+            "wait_ms_max": round(stats["wait_max"] * 1000, 3),
+        }
+        if isinstance(self, QueuePool):
+            result.update({
+                "size": self.size(),
+                "checked_in": self.checkedin(),
+                "overflow": max(self.overflow(), 0),
+                "max_overflow": self._max_overflow,
+            })
+        return result
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+class TimedNullPool(_TimedCheckout, NullPool):
+    pass
+
+def engine_options(is_async: bool) -> dict:
+    """create_engine/create_async_engine keyword arguments for the configured pool"""
+    if DB_PGBOUNCER:
+        return {"poolclass": TimedNullPool, "pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+def asyncpg_connect_args(read_only: bool = False, statement_timeout: bool = True) -> dict:
+    """asyncpg connect() arguments: statement timeout and read-only mode, or PgBouncer-safe statement caching"""
+    if DB_PGBOUNCER:
+        # Startup parameters aren't forwarded by PgBouncer; set statement_timeout
+        # on the database role the API uses instead (ALTER ROLE ... SET statement_timeout)
+        return {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    server_settings = {}
+    if statement_timeout and DB_STATEMENT_TIMEOUT_MS > 0:
+        server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+    if read_only:
+        server_settings["default_transaction_read_only"] = "on"
+    return {"server_settings": server_settings} if server_settings else {}
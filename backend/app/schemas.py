@@ -13,6 +13,14 @@ class PostIn(BaseModel):
     summary: str
     tags: Optional[List[str]] = None
 
+class PostImport(PostIn):
+    """One line of a bulk import; votes defaults to a random starting count like POST /posts"""
+    votes: Optional[int] = None
+
+class BulkImportResponse(BaseModel):
+    inserted: int
+    batches: int
+
 class PostOut(BaseModel):
     id: int
     votes: int
@@ -34,7 +42,16 @@ class PostOut(BaseModel):
 
 class PostsResponse(BaseModel):
     items: List[PostOut]
-    total: int
+    total: Optional[int] = None  # only set on the first page when requested
+    next_cursor: Optional[str] = None
+
+class UserPostState(BaseModel):
+    post_id: int
+    user_vote: int = 0  # -1, 0, or 1
+    saved: bool = False
+
+class UserStateResponse(BaseModel):
+    items: List[UserPostState]
 
 class CauseAnalytics(BaseModel):
     cause: str
@@ -45,6 +62,27 @@ class TopCausesResponse(BaseModel):
     items: List[CauseAnalytics]
     total: int
 
+class BreakdownItem(BaseModel):
+    cause: Optional[str] = None
+    severity: Optional[str] = None
+    category: Optional[str] = None
+    year: Optional[int] = None
+    tag: Optional[str] = None
+    count: int
+    votes: Optional[int] = None  # not tracked for tag breakdowns
+
+class BreakdownResponse(BaseModel):
+    items: List[BreakdownItem]
+    total: int
+
+class Suggestion(BaseModel):
+    text: str
+    kind: str  # 'title', 'product', 'cause' or 'tag'
+    post_id: Optional[int] = None  # set for titles
+
+class SuggestResponse(BaseModel):
+    items: List[Suggestion]
+
 class AuthResponse(BaseModel):
     user_id: str
 
@@ -69,3 +107,7 @@ class CommentOut(BaseModel):
     class Config:
         from_attributes = True
 
+class CommentsResponse(BaseModel):
+    items: List[CommentOut]
+    next_cursor: Optional[str] = None
+
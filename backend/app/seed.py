@@ -1,7 +1,11 @@
 """Seed the database with demo posts from the frontend"""
+import asyncio
 import sys
-from app.db import SessionLocal, init_db
-from app.models import Post, Tag
+from sqlalchemy import func, select
+from app.db import JobSessionLocal, job_engine
+from app.migrations import migrate
+from app.models import Post
+from app.crud import insert_posts
 
 # Demo posts from frontend
 DEMO_POSTS = [
@@ -73,55 +77,34 @@ DEMO_POSTS = [
     }
 ]
 
-def seed_database():
+async def seed_database():
     """Seed the database with demo posts"""
-    print("Initializing database tables...")
-    init_db()
+    print("Migrating database schema...")
+    migrate()
     
-    db = SessionLocal()
-    try:
-        # Check if posts already exist
-        existing_count = db.query(Post).count()
-        if existing_count > 0:
-            print(f"Database already has {existing_count} posts. Skipping seed.")
-            return
+    async with JobSessionLocal() as db:
+        try:
+            await _seed(db)
+        except Exception as e:
+            await db.rollback()
+            print(f"Error seeding database: {e}")
+            sys.exit(1)
+    await job_engine.dispose()
 
-        print("Seeding database with demo posts...")
-        for post_data in DEMO_POSTS:
-            # Create tags first
-            tags = []
-            for tag_name in post_data["tags"]:
-                tag = db.query(Tag).filter(Tag.name == tag_name.lower()).first()
-                if not tag:
-                    tag = Tag(name=tag_name.lower())
-                    db.add(tag)
-                    db.flush()
-                tags.append(tag)
+async def _seed(db):
+    """Insert the demo posts unless the atlas already has posts"""
+    # Check if posts already exist
+    existing_count = (await db.execute(select(func.count()).select_from(Post))).scalar()
+    if existing_count > 0:
+        print(f"Database already has {existing_count} posts. Skipping seed.")
+        return
 
-            # Create post with specific votes
-            post = Post(
-                title=post_data["title"],
-                product=post_data["product"],
-                year=post_data["year"],
-                category=post_data["category"],
-                cause=post_data["cause"].lower(),
-                severity=post_data["severity"].lower(),
-                summary=post_data["summary"],
-                votes=post_data["votes"],
-                tags=tags
-            )
-            db.add(post)
-
-        db.commit()
-        print(f"Successfully seeded {len(DEMO_POSTS)} posts!")
-        
-    except Exception as e:
-        db.rollback()
-        print(f"Error seeding database: {e}")
-        sys.exit(1)
-    finally:
-        db.close()
+    print("Seeding database with demo posts...")
+    # Demo posts carry their own vote counts
+    await insert_posts(db, DEMO_POSTS)
+    await db.commit()
+    print(f"Successfully seeded {len(DEMO_POSTS)} posts!")
 
 if __name__ == "__main__":
-    seed_database()
+    asyncio.run(seed_database())
 
@@ -0,0 +1,268 @@
+"""In-process prefix index for search-as-you-type suggestions
+
+The index is a sorted array of (key, kind, text) entries searched with
+bisect, so a lookup never touches Postgres. Titles are indexed under every
+word start ("glass trust gap" completes "Google Glass: the trust gap..."),
+products, tags and causes under their full lowercase text. It is built once
+at startup; each worker process keeps its own copy. A worker indexes the
+posts it creates right away, and a background thread polls for posts created
+anywhere else (other workers, app.importer, app.seed) every
+SUGGEST_REFRESH_SECONDS. Post ids are drawn before the inserting transaction
+commits, so ids can become visible out of order: the poll also re-checks
+unindexed ids among the last SUGGEST_REFRESH_WINDOW.
+
+Short prefixes match a large share of the index, so prefixes of up to
+CACHED_PREFIX_LEN characters keep a cached list of their best completions,
+maintained on build and on every add. Longer prefixes select a narrow key
+range, which is scanned in full.
+"""
+import bisect
+import heapq
+import os
+import re
+import threading
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.db import engine
+
+SUGGEST_REFRESH_SECONDS = float(os.getenv("SUGGEST_REFRESH_SECONDS", "2"))  # 0 disables
+# Recent post ids re-checked on every poll, for inserts that commit late
+SUGGEST_REFRESH_WINDOW = 20000
+# Posts fetched per query when catching up
+SUGGEST_REFRESH_BATCH = 5000
+
+# Prefixes up to this length answer from a cached top list instead of a scan
+CACHED_PREFIX_LEN = 3
+# Completions cached per short prefix; the most GET /suggest returns
+CACHED_TOP = 50
+
+def _normalize(value: str) -> str:
+    return " ".join(re.findall(r"[^\W_]+", value.lower()))
+
+class PrefixIndex:
+    def __init__(self):
+        self._keys = []  # sorted (key, is_word_suffix, kind, text)
+        self._weights = {}  # (kind, text) -> weight
+        self._post_ids = {}  # title -> post id
+        self._top = {}  # short prefix -> best (rank, kind, text), highest first
+        self._last_id = 0  # highest indexed post id
+        self._indexed_ids = set()  # indexed post ids above _last_id - SUGGEST_REFRESH_WINDOW
+        self._lock = threading.Lock()
+
+    def _entries(self, kind: str, value: str):
+        key = _normalize(value)
+        if not key:
+            return []
+        if kind != "title":
+            return [(key, False, kind, value)]
+        # Index titles under every word start
+        words = key.split(" ")
+        return [(" ".join(words[i:]), i > 0, kind, value) for i in range(len(words))]
+
+    def _prefix_ranks(self, kind: str, value: str) -> dict:
+        """Rank of (kind, value) under each short prefix of its keys"""
+        weight = self._weights.get((kind, value), 0)
+        ranks = {}
+        for key, is_word_suffix, _, _ in self._entries(kind, value):
+            rank = (not is_word_suffix, weight)
+            for n in range(1, min(len(key), CACHED_PREFIX_LEN) + 1):
+                if key[:n] not in ranks or ranks[key[:n]] < rank:
+                    ranks[key[:n]] = rank
+        return ranks
+
+    def _update_top(self, kind: str, value: str):
+        """Re-rank (kind, value) in the cached lists after its weight grew"""
+        for prefix, rank in self._prefix_ranks(kind, value).items():
+            top = [entry for entry in self._top.get(prefix, ()) if entry[1:] != (kind, value)]
+            if len(top) < CACHED_TOP or rank > top[-1][0]:
+                top.append((rank, kind, value))
+                top.sort(reverse=True)
+                # Replaced, not mutated, so concurrent lookups see a whole list
+                self._top[prefix] = top[:CACHED_TOP]
+
+    def build(self, items: list):
+        """Replace the index with (kind, text, weight, post_id) items"""
+        keys = []
+        weights = {}
+        post_ids = {}
+        indexed_ids = []
+        for kind, value, weight, post_id in items:
+            if (kind, value) not in weights:
+                keys.extend(self._entries(kind, value))
+            weights[(kind, value)] = weights.get((kind, value), 0) + weight
+            if post_id is not None:
+                post_ids[value] = post_id
+                indexed_ids.append(post_id)
+        keys.sort()
+        heaps = {}
+        last_id = max(indexed_ids, default=0)
+        with self._lock:
+            self._keys, self._weights, self._post_ids = keys, weights, post_ids
+            self._last_id = last_id
+            self._indexed_ids = {post_id for post_id in indexed_ids if post_id > last_id - SUGGEST_REFRESH_WINDOW}
+            for kind, value in weights:
+                for prefix, rank in self._prefix_ranks(kind, value).items():
+                    heap = heaps.setdefault(prefix, [])
+                    if len(heap) < CACHED_TOP:
+                        heapq.heappush(heap, (rank, kind, value))
+                    else:
+                        heapq.heappushpop(heap, (rank, kind, value))
+            self._top = {prefix: sorted(heap, reverse=True) for prefix, heap in heaps.items()}
+
+    def add(self, kind: str, value: str, weight: int = 1, post_id: Optional[int] = None):
+        """Add one suggestion, or bump its weight if it is already indexed"""
+        with self._lock:
+            if (kind, value) not in self._weights:
+                for entry in self._entries(kind, value):
+                    bisect.insort(self._keys, entry)
+            self._weights[(kind, value)] = self._weights.get((kind, value), 0) + weight
+            self._update_top(kind, value)
+            if post_id is not None:
+                self._post_ids[value] = post_id
+
+    def complete(self, prefix: str, limit: int = 10) -> list:
+        """Top completions for prefix: whole-text matches first, then by weight"""
+        prefix = _normalize(prefix)
+        if not prefix:
+            return []
+        if len(prefix) <= CACHED_PREFIX_LEN:
+            top = [(kind, value) for _, kind, value in self._top.get(prefix, ())[:limit]]
+        else:
+            keys = self._keys
+            best = {}
+            # The whole matching range is ranked; a cut-off would rank an alphabetical slice
+            for i in range(bisect.bisect_left(keys, (prefix,)), len(keys)):
+                key, is_word_suffix, kind, value = keys[i]
+                if not key.startswith(prefix):
+                    break
+                rank = (not is_word_suffix, self._weights.get((kind, value), 0))
+                if (kind, value) not in best or best[(kind, value)] < rank:
+                    best[(kind, value)] = rank
+            top = [item for item, _ in heapq.nlargest(limit, best.items(), key=lambda item: item[1])]
+        return [
+            {"text": value, "kind": kind, "post_id": self._post_ids.get(value) if kind == "title" else None}
+            for kind, value in top
+        ]
+
+    def _claim(self, post_ids: list) -> set:
+        """Record post ids as indexed, returning the ones that were not already"""
+        with self._lock:
+            floor = self._last_id - SUGGEST_REFRESH_WINDOW
+            claimed = {post_id for post_id in post_ids if post_id > floor and post_id not in self._indexed_ids}
+            if not claimed:
+                return claimed
+            self._indexed_ids |= claimed
+            self._last_id = max(self._last_id, max(claimed))
+            if len(self._indexed_ids) > 2 * SUGGEST_REFRESH_WINDOW:
+                floor = self._last_id - SUGGEST_REFRESH_WINDOW
+                self._indexed_ids = {post_id for post_id in self._indexed_ids if post_id > floor}
+            return claimed
+
+    def unindexed_ids(self) -> tuple:
+        """(highest indexed post id, ids within the refresh window below it that are not indexed)"""
+        with self._lock:
+            floor = max(self._last_id - SUGGEST_REFRESH_WINDOW, 0)
+            gaps = [post_id for post_id in range(floor + 1, self._last_id) if post_id not in self._indexed_ids]
+            return self._last_id, gaps
+
+    def add_post(self, post: dict):
+        """Index a newly created post (once, however many times it is seen)"""
+        if not self._claim([post["id"]]):
+            return
+        self.add("title", post["title"], post["votes"], post["id"])
+        self.add("product", post["product"])
+        self.add("cause", post["cause"])
+        for tag in post["tags"]:
+            self.add("tag", tag)
+
+    def add_posts(self, posts: list):
+        """Index a batch of new posts with one sort instead of an insort per entry"""
+        claimed = self._claim([post["id"] for post in posts])
+        posts = [post for post in posts if post["id"] in claimed]
+        if not posts:
+            return
+        with self._lock:
+            # Lookups keep reading the old array until the sorted copy replaces it
+            keys = list(self._keys)
+            for post in posts:
+                items = [("title", post["title"], post["votes"]), ("product", post["product"], 1), ("cause", post["cause"], 1)]
+                items += [("tag", tag, 1) for tag in post["tags"]]
+                for kind, value, weight in items:
+                    if (kind, value) not in self._weights:
+                        keys.extend(self._entries(kind, value))
+                    self._weights[(kind, value)] = self._weights.get((kind, value), 0) + weight
+                    self._update_top(kind, value)
+                self._post_ids[post["title"]] = post["id"]
+            keys.sort()
+            self._keys = keys
+
+suggest_index = PrefixIndex()
+
+def build_suggest_index(db: Session):
+    """Load titles, products, causes and tags into the in-process index"""
+    rows = db.execute(text("""
+        SELECT 'title', title, votes, id FROM posts
+        UNION ALL
+        SELECT 'product', product, COUNT(*), NULL FROM posts GROUP BY product
+        UNION ALL
+        SELECT 'cause', cause, COUNT(*), NULL FROM posts GROUP BY cause
+        UNION ALL
+        SELECT 'tag', t.name, COUNT(pt.post_id), NULL
+        FROM tags t LEFT JOIN post_tags pt ON pt.tag_id = t.id
+        GROUP BY t.name
+    """)).fetchall()
+    suggest_index.build([(row[0], row[1], row[2], row[3]) for row in rows])
+    print(f"Built suggest index ({len(rows)} entries)")
+
+_REFRESH_COLUMNS = """
+    SELECT p.id, p.title, p.product, p.cause, p.votes,
+           ARRAY(
+               SELECT t.name FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+               WHERE pt.post_id = p.id
+           ) AS tags
+    FROM posts p
+"""
+
+def refresh_suggest_index(db) -> int:
+    """Index posts created since the last refresh by any process, returning how many were added"""
+    last_id, gaps = suggest_index.unindexed_ids()
+    rows = []
+    if gaps:
+        rows += db.execute(text(_REFRESH_COLUMNS + "WHERE p.id = ANY(:gaps)"), {"gaps": gaps}).fetchall()
+    while True:
+        batch = db.execute(
+            text(_REFRESH_COLUMNS + "WHERE p.id > :after ORDER BY p.id LIMIT :batch"),
+            {"after": last_id, "batch": SUGGEST_REFRESH_BATCH}
+        ).fetchall()
+        rows += batch
+        if len(batch) < SUGGEST_REFRESH_BATCH:
+            break
+        last_id = batch[-1][0]
+    posts = [
+        {"id": row[0], "title": row[1], "product": row[2], "cause": row[3], "votes": row[4], "tags": list(row[5])}
+        for row in rows
+    ]
+    suggest_index.add_posts(posts)
+    return len(posts)
+
+_stop_refresher = threading.Event()
+
+def _refresh_loop():
+    while not _stop_refresher.wait(SUGGEST_REFRESH_SECONDS):
+        try:
+            with engine.connect() as conn:
+                refresh_suggest_index(conn)
+        except Exception as e:
+            print(f"Error refreshing suggest index: {e}")
+
+def start_suggest_refresher():
+    """Start the background thread that indexes posts created by other processes, unless it is disabled"""
+    if SUGGEST_REFRESH_SECONDS <= 0:
+        return
+    _stop_refresher.clear()
+    threading.Thread(target=_refresh_loop, name="suggest-refresher", daemon=True).start()
+    print(f"Started suggest index refresher (every {SUGGEST_REFRESH_SECONDS}s)")
+
+def stop_suggest_refresher():
+    _stop_refresher.set()
@@ -0,0 +1,66 @@
+"""Process-wide tag name -> id cache
+
+The tags table is small and rows are never deleted, so once a name has an
+id it keeps it. Each worker warms the cache at startup and crud.resolve_tag_ids
+only goes to Postgres (one batched upsert) for names it has not seen, so tag
+resolution is usually free. Workers need no coordination: the unique
+constraint on tags.name makes concurrent upserts of the same name agree on
+one id.
+
+Ids of tags created by a transaction are only remembered once it commits; a
+rolled-back transaction's tags never existed.
+"""
+import threading
+from typing import Iterable
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+# Session.info key holding tags created by the current transaction
+PENDING_KEY = "new_tag_ids"
+
+class TagCache:
+    def __init__(self):
+        self._ids = {}  # name -> id
+        self._lock = threading.Lock()
+
+    def lookup(self, names: Iterable[str]) -> tuple:
+        """Split names into ({name: id} for cached names, [names to resolve])"""
+        found = {}
+        missing = []
+        ids = self._ids
+        for name in names:
+            tag_id = ids.get(name)
+            if tag_id is None:
+                missing.append(name)
+            else:
+                found[name] = tag_id
+        return found, missing
+
+    def update(self, ids: dict):
+        with self._lock:
+            self._ids.update(ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+tag_cache = TagCache()
+
+def remember_after_commit(session: Session, ids: dict):
+    """Add ids to the cache when session's current transaction commits"""
+    session.info.setdefault(PENDING_KEY, {}).update(ids)
+
+@event.listens_for(Session, "after_commit")
+def _remember_committed_tags(session: Session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        tag_cache.update(pending)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_tags(session: Session):
+    session.info.pop(PENDING_KEY, None)
+
+def warm_tag_cache(db: Session):
+    """Load every tag into the cache"""
+    rows = db.execute(text("SELECT name, id FROM tags")).fetchall()
+    tag_cache.update({name: tag_id for name, tag_id in rows})
+    print(f"Warmed tag cache ({len(rows)} tags)")
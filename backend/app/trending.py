@@ -0,0 +1,109 @@
+"""Background re-scoring of the time-decayed "trending" sort
+
+trend_score follows the Reddit/HN gravity idea in a time-invariant form:
+
+    sign(votes) * log10(max(|votes|, 1))   vote magnitude, diminishing returns
+  + log10(1 + upvotes in the last window)  recent vote velocity
+  + epoch(created_at) / 45000              newer posts outrank older ones
+
+Because age enters as an absolute timestamp rather than "hours since", a
+score only changes when its inputs change, so each pass only touches posts
+whose votes moved (posts.votes differs from posts.scored_votes, served by a
+partial index) or whose recent votes just aged out of the velocity window.
+"""
+import os
+import threading
+from sqlalchemy import text
+from app.db import engine
+
+TRENDING_INTERVAL_SECONDS = float(os.getenv("TRENDING_INTERVAL_SECONDS", "60"))  # 0 disables
+TRENDING_WINDOW_HOURS = float(os.getenv("TRENDING_WINDOW_HOURS", "24"))
+TRENDING_BATCH_SIZE = int(os.getenv("TRENDING_BATCH_SIZE", "5000"))
+
+# Advisory lock key so only one worker re-scores at a time
+RESCORE_LOCK_ID = 7_420_002
+
+_stop_rescorer = threading.Event()
+
+_SCORE_SQL = """
+    UPDATE posts p
+    SET trend_score =
+            SIGN(p.votes) * LOG(GREATEST(ABS(p.votes), 1))
+            + LOG(1 + (
+                SELECT COUNT(*) FROM votes v
+                WHERE v.post_id = p.id AND v.value = 1
+                  AND v.created_at > now() - :window_hours * interval '1 hour'
+            ))
+            + EXTRACT(EPOCH FROM COALESCE(p.created_at, now())) / 45000,
+        scored_votes = p.votes
+    WHERE p.id IN ({dirty_sql})
+"""
+
+def rescore_trending(conn) -> int:
+    """Recompute trend_score for posts whose inputs changed, returning how many were scored.
+
+    Commits after every batch so a large backlog (e.g. the first pass after
+    deploying) never holds long row locks. Returns 0 without doing anything if
+    another worker is already re-scoring.
+    """
+    if not conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": RESCORE_LOCK_ID}).scalar():
+        conn.commit()
+        return 0
+    try:
+        return _rescore(conn)
+    finally:
+        # Discard a failed batch before releasing the session-level lock
+        conn.rollback()
+        conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": RESCORE_LOCK_ID})
+        conn.commit()
+
+def _rescore(conn) -> int:
+    params = {"window_hours": TRENDING_WINDOW_HOURS, "batch": TRENDING_BATCH_SIZE}
+
+    # Posts whose vote total changed since they were last scored (including new posts)
+    scored = 0
+    while True:
+        result = conn.execute(text(_SCORE_SQL.format(dirty_sql="""
+            SELECT id FROM posts WHERE votes IS DISTINCT FROM scored_votes LIMIT :batch
+        """)), params)
+        conn.commit()
+        scored += result.rowcount
+        if result.rowcount < TRENDING_BATCH_SIZE:
+            break
+
+    # Posts with upvotes that left the velocity window since the last pass
+    last_run_at = conn.execute(text("SELECT last_run_at FROM job_runs WHERE name = 'trending'")).scalar()
+    if last_run_at is not None:
+        result = conn.execute(text(_SCORE_SQL.format(dirty_sql="""
+            SELECT DISTINCT post_id FROM votes
+            WHERE value = 1
+              AND created_at > CAST(:last_run_at AS timestamptz) - :window_hours * interval '1 hour'
+              AND created_at <= now() - :window_hours * interval '1 hour'
+        """)), dict(params, last_run_at=last_run_at))
+        scored += result.rowcount
+
+    conn.execute(text("""
+        INSERT INTO job_runs (name, last_run_at) VALUES ('trending', now())
+        ON CONFLICT (name) DO UPDATE SET last_run_at = EXCLUDED.last_run_at
+    """))
+    conn.commit()
+    return scored
+
+def _rescore_loop():
+    while not _stop_rescorer.wait(TRENDING_INTERVAL_SECONDS):
+        try:
+            with engine.connect() as conn:
+                rescore_trending(conn)
+        except Exception as e:
+            print(f"Error re-scoring trending posts: {e}")
+
+def start_trending_rescorer():
+    """Start the background re-scoring thread unless it is disabled"""
+    if TRENDING_INTERVAL_SECONDS <= 0:
+        return
+    _stop_rescorer.clear()
+    threading.Thread(target=_rescore_loop, name="trending-rescorer", daemon=True).start()
+    print(f"Started trending re-scorer (every {TRENDING_INTERVAL_SECONDS}s)")
+
+def stop_trending_rescorer():
+    _stop_rescorer.set()
@@ -0,0 +1 @@
+# Failure Atlas load tests and benchmarks
@@ -0,0 +1,57 @@
+"""Measure bulk import throughput of the NDJSON importer
+
+Usage:
+    python -m bench.bulk_import [--posts 200000] [--batch-size 5000] [--tags 500]
+
+Generates synthetic posts in memory and imports them through the same path as
+POST /posts/bulk and python -m app.importer. The posts stay in the database,
+so run it against a scratch database. The target is 50k+ posts/s locally.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from app.db import JobSessionLocal, job_engine
+from app.importer import import_ndjson
+
+CAUSES = ["distribution", "pricing", "privacy", "onboarding", "outage", "rollout", "trust", "timing"]
+SEVERITIES = ["low", "med", "high"]
+WORDS = ["launch", "beta", "sync", "billing", "mobile", "cloud", "partner", "retention", "churn", "api"]
+
+def synthetic_post(i: int, tags: int) -> dict:
+    return {
+        "title": f"Incident {i}: {' '.join(random.sample(WORDS, 3))}",
+        "product": f"Product {i % 5000}",
+        "year": random.randint(2005, 2025),
+        "category": random.choice(["consumer", "enterprise", "hardware", "platform"]),
+        "cause": random.choice(CAUSES),
+        "severity": random.choice(SEVERITIES),
+        "summary": " ".join(random.choices(WORDS, k=40)),
+        "votes": random.randint(0, 500),
+        "tags": [f"tag-{random.randrange(tags)}" for _ in range(random.randint(1, 4))],
+    }
+
+async def chunks(body: bytes, size: int = 1 << 20):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+async def run(args):
+    body = "".join(json.dumps(synthetic_post(i, args.tags)) + "\n" for i in range(args.posts)).encode()
+    start = time.perf_counter()
+    async with JobSessionLocal() as db:
+        inserted, batches = await import_ndjson(db, chunks(body), args.batch_size)
+    elapsed = time.perf_counter() - start
+    await job_engine.dispose()
+    print(f"{inserted} posts in {batches} batches of {args.batch_size} in {elapsed:.2f}s "
+          f"({inserted / elapsed:.0f} posts/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--tags", type=int, default=500, help="distinct tag names")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
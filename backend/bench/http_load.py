@@ -0,0 +1,110 @@
+"""Load-test the HTTP API with hundreds of concurrent keep-alive connections
+
+Usage:
+    python -m bench.http_load [--url http://localhost:8000] [--connections 500] [--duration 30]
+                              [--path "/posts?limit=20"] [--user-id <uuid>]
+
+Each connection is one asyncio task sending requests back to back over its own
+keep-alive socket, cycling through --path. Start the API with
+`uvicorn app.main:app` and run this once per build to compare them: with sync
+routes, requests beyond Starlette's 40-thread pool queue inside the server and
+show up as tail latency. Pass --user-id (or start the server with
+CACHE_BACKEND=none) to measure the database path rather than the response
+cache. Only endpoints that send a Content-Length (not streaming ones) are
+supported.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = [
+    "/posts?limit=20",
+    "/posts?limit=20&sort=new",
+    "/posts?limit=20&cause=distribution",
+    "/analytics/top-causes",
+]
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+async def read_response(reader: asyncio.StreamReader) -> int:
+    """Read one response off a keep-alive connection and return its status code"""
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+    lines = head.split("\r\n")
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return int(lines[0].split(" ")[1])
+
+async def connection(host: str, port: int, requests: list, deadline: float, samples: list, errors: Counter):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError as e:
+        errors[type(e).__name__] += 1
+        return
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            request = requests[i % len(requests)]
+            i += 1
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = await read_response(reader)
+            samples.append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors[f"HTTP {status}"] += 1
+    except (OSError, asyncio.IncompleteReadError) as e:
+        errors[type(e).__name__] += 1
+    finally:
+        writer.close()
+
+async def run(args) -> tuple:
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    headers = f"Host: {host}\r\n"
+    if args.user_id:
+        headers += f"X-User-Id: {args.user_id}\r\n"
+    requests = [f"GET {path} HTTP/1.1\r\n{headers}\r\n".encode() for path in args.path or DEFAULT_PATHS]
+
+    samples = []
+    errors = Counter()
+    deadline = time.perf_counter() + args.duration
+    await asyncio.gather(*[
+        connection(host, port, requests, deadline, samples, errors)
+        for _ in range(args.connections)
+    ])
+    return samples, errors
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--path", action="append", help="request path (repeatable)")
+    parser.add_argument("--user-id", help="send X-User-Id so /posts bypasses the response cache")
+    args = parser.parse_args()
+
+    samples, errors = asyncio.run(run(args))
+    if not samples:
+        print(f"No successful requests ({dict(errors)})")
+        return
+
+    print(f"{len(samples)} requests over {args.connections} connections in {args.duration:.0f}s "
+          f"({len(samples) / args.duration:.0f} req/s)")
+    print(f"p50 {statistics.median(samples):.1f} ms, "
+          f"p95 {percentile(samples, 0.95):.1f} ms, "
+          f"p99 {percentile(samples, 0.99):.1f} ms, "
+          f"max {max(samples):.1f} ms")
+    if errors:
+        print(f"errors: {dict(errors)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Measure search-as-you-type latency of the prefix search mode
+
+Usage:
+    python -m bench.search_latency [--limit 100] [--min-chars 3] [--words quibi distribution ...]
+
+Each word is "typed" one character at a time, starting at --min-chars
+characters, and every prefix is searched once per round, the way the
+frontend search box issues requests. Searches use the GET /posts defaults
+(first page of 100, hot sort, no filters); prefix mode never computes a
+total. Load a large atlas first (e.g. 1M posts) for meaningful numbers; the
+target is a p99 under 20 ms.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from app.db import AsyncSessionLocal, async_engine
+from app.crud import get_posts
+
+DEFAULT_WORDS = ["quibi", "distribution", "privacy", "rollout", "pricing", "onboarding", "outage"]
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+async def measure(prefixes: list, limit: int, rounds: int, match: str) -> list:
+    async with AsyncSessionLocal() as db:
+        # Warm up caches and connections
+        for prefix in prefixes:
+            await get_posts(db, q=prefix, limit=limit, match=match)
+
+        samples = []
+        for _ in range(rounds):
+            for prefix in prefixes:
+                start = time.perf_counter()
+                await get_posts(db, q=prefix, limit=limit, match=match)
+                samples.append((time.perf_counter() - start) * 1000)
+    await async_engine.dispose()
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=100, help="page size (GET /posts default: 100)")
+    parser.add_argument("--min-chars", type=int, default=3, help="shortest prefix searched")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--match", default="prefix", choices=["prefix", "fts"])
+    parser.add_argument("--words", nargs="+", default=DEFAULT_WORDS)
+    args = parser.parse_args()
+
+    prefixes = [word[:n] for word in args.words for n in range(args.min_chars, len(word) + 1)]
+
+    samples = asyncio.run(measure(prefixes, args.limit, args.rounds, args.match))
+
+    print(f"{len(samples)} {args.match} searches, limit {args.limit}")
+    print(f"p50 {statistics.median(samples):.1f} ms, "
+          f"p95 {percentile(samples, 0.95):.1f} ms, "
+          f"p99 {percentile(samples, 0.99):.1f} ms, "
+          f"max {max(samples):.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Hammer one hot post with concurrent votes and check the counter stays exact
+
+Usage:
+    python -m bench.vote_contention [--post-id 1] [--clients 64] [--votes 50]
+
+Every client is an anonymous user; pairs of clients share a user id so the
+same (user, post) vote row is also contended. After the run, the change in
+posts.votes must equal the change in SUM(votes.value) for the post.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from sqlalchemy import text
+from app.db import AsyncSessionLocal, async_engine
+from app.crud import vote_post
+
+async def snapshot(post_id: int):
+    """Return (posts.votes, SUM(votes.value)) for a post"""
+    async with async_engine.connect() as conn:
+        row = (await conn.execute(
+            text("""
+                SELECT p.votes, COALESCE((SELECT SUM(value) FROM votes WHERE post_id = p.id), 0)
+                FROM posts p WHERE p.id = :post_id
+            """),
+            {"post_id": post_id}
+        )).fetchone()
+    if row is None:
+        print(f"Post {post_id} not found")
+        sys.exit(1)
+    return row[0], row[1]
+
+async def client(user_id: str, post_id: int, votes: int):
+    async with AsyncSessionLocal() as db:
+        for _ in range(votes):
+            await vote_post(db, user_id, post_id, random.choice((-1, 0, 1)))
+
+async def run(args):
+    before_votes, before_sum = await snapshot(args.post_id)
+    user_ids = [str(uuid.uuid4()) for _ in range((args.clients + 1) // 2)]
+
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        client(user_ids[i // 2], args.post_id, args.votes)
+        for i in range(args.clients)
+    ])
+    elapsed = time.perf_counter() - start
+
+    after_votes, after_sum = await snapshot(args.post_id)
+    await async_engine.dispose()
+    total = args.clients * args.votes
+    print(f"{total} votes from {args.clients} clients in {elapsed:.2f}s ({total / elapsed:.0f} votes/s)")
+    print(f"posts.votes delta: {after_votes - before_votes}, SUM(votes.value) delta: {after_sum - before_sum}")
+
+    if after_votes - before_votes != after_sum - before_sum:
+        print("FAIL: posts.votes drifted from the votes table")
+        sys.exit(1)
+    print("OK: posts.votes matches the votes table")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--post-id", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--votes", type=int, default=50, help="votes per client")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
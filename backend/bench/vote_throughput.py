@@ -0,0 +1,51 @@
+"""Compare hot-row vote throughput of the direct and sharded counter modes
+
+Usage:
+    python -m bench.vote_throughput [--post-id 1] [--clients 15] [--votes 50]
+
+Each client is a separate user flipping its vote on the same post, so every
+vote changes the counter. Both modes run against the same database; pending
+shards and rollup deltas are folded at the end so posts.votes is left exact.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from app import counters
+from app.db import AsyncSessionLocal, async_engine, engine
+from app.crud import vote_post
+
+async def client(post_id: int, votes: int):
+    user_id = str(uuid.uuid4())
+    async with AsyncSessionLocal() as db:
+        for i in range(votes):
+            await vote_post(db, user_id, post_id, 1 if i % 2 == 0 else -1)
+
+async def run(mode: str, post_id: int, clients: int, votes: int) -> float:
+    counters.VOTE_COUNTER_MODE = mode
+    start = time.perf_counter()
+    await asyncio.gather(*[client(post_id, votes) for _ in range(clients)])
+    elapsed = time.perf_counter() - start
+    # Pooled asyncpg connections belong to this event loop
+    await async_engine.dispose()
+    return clients * votes / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--post-id", type=int, default=1)
+    # Default engine pool allows 5 + 10 overflow connections
+    parser.add_argument("--clients", type=int, default=15)
+    parser.add_argument("--votes", type=int, default=50, help="votes per client")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("direct", "sharded"):
+        results[mode] = asyncio.run(run(mode, args.post_id, args.clients, args.votes))
+        print(f"{mode:>8}: {results[mode]:.0f} votes/s")
+
+    with engine.begin() as conn:
+        counters.fold_counters(conn)
+    print(f"sharded / direct: {results['sharded'] / results['direct']:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+
+# app.db reads DATABASE_URL on import, and the pure unit tests may import it
+# (through app.crud or app.suggest) before a database test module sets it
+if os.getenv("TEST_DATABASE_URL"):
+    os.environ["DATABASE_URL"] = os.environ["TEST_DATABASE_URL"]
@@ -0,0 +1,222 @@
+"""Response cache: generation checks, quiet periods, TTL expiry, LRU eviction
+and the Redis WATCH path (against an in-memory stand-in for the client)"""
+import pytest
+from app import cache
+from app.cache import CacheBackend, MemoryCache, RedisCache
+
+class Clock:
+    """Stands in for the time module so tests can move time forward"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+def test_invalidate_drops_tagged_entries_only(clock):
+    memory = MemoryCache()
+    memory.set("feed", b"feed", ["post:1", "feed:all:all"])
+    memory.set("other", b"other", ["post:2"])
+    memory.invalidate(["post:1"])
+    assert memory.get("feed") is None
+    assert memory.get("other") == b"other"
+    assert memory.stats()["invalidations"] == 1
+
+def test_set_skipped_when_tag_invalidated_during_read(clock):
+    memory = MemoryCache()
+    since = memory.generation()
+    # A write commits and invalidates while the page is being read
+    memory.invalidate(["post:1"])
+    memory.set("feed", b"stale", ["post:1"], since=since)
+    memory.set("other", b"fresh", ["post:2"], since=since)
+    assert memory.get("feed") is None
+    assert memory.get("other") == b"fresh"
+    stats = memory.stats()
+    assert (stats["sets"], stats["stale_sets"]) == (1, 1)
+
+def test_set_after_invalidation_read_from_new_generation(clock):
+    memory = MemoryCache()
+    memory.invalidate(["post:1"])
+    memory.set("feed", b"fresh", ["post:1"], since=memory.generation())
+    assert memory.get("feed") == b"fresh"
+
+def test_set_skipped_when_generation_history_forgotten(clock, monkeypatch):
+    monkeypatch.setattr(cache, "INVALIDATION_HISTORY", 2)
+    memory = MemoryCache()
+    since = memory.generation()
+    for n in range(3):
+        memory.invalidate([f"post:{n}"])
+    # post:0 fell out of the history, so any tag may have changed since
+    memory.set("feed", b"stale", ["post:9"], since=since)
+    assert memory.get("feed") is None
+
+def test_quiet_seconds_skips_recently_invalidated_tags(clock):
+    memory = MemoryCache()
+    memory.invalidate(["post:1"])
+    since = memory.generation()
+    clock.now += 2
+    memory.set("feed", b"replica", ["post:1"], since=since, quiet_seconds=5)
+    assert memory.get("feed") is None
+    clock.now += 4
+    memory.set("feed", b"replica", ["post:1"], since=since, quiet_seconds=5)
+    assert memory.get("feed") == b"replica"
+
+def test_entries_expire_after_ttl(clock):
+    memory = MemoryCache()
+    memory.set("feed", b"feed", ["post:1"], ttl=30)
+    clock.now += 29
+    assert memory.get("feed") == b"feed"
+    clock.now += 2
+    assert memory.get("feed") is None
+    # The expired entry is gone from the tag index too
+    memory.invalidate(["post:1"])
+    assert memory.stats()["invalidations"] == 0
+
+def test_least_recently_used_entry_is_evicted(clock):
+    memory = MemoryCache(max_entries=2)
+    memory.set("a", b"a", ["post:1"])
+    memory.set("b", b"b", ["post:2"])
+    assert memory.get("a") == b"a"
+    memory.set("c", b"c", ["post:3"])
+    assert memory.get("b") is None
+    assert memory.get("a") == b"a"
+    assert memory.get("c") == b"c"
+    assert memory.stats()["evictions"] == 1
+
+class FakeWatchError(Exception):
+    pass
+
+class FakeRedis:
+    """The subset of redis.Redis that RedisCache uses, with WATCH semantics"""
+
+    def __init__(self):
+        self.data = {}
+        self.versions = {}
+        # Called by the next pipeline between its WATCHed reads and EXEC
+        self.before_exec = None
+
+    def _write(self, key, value):
+        self.data[key] = value
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, px=None):
+        self._write(key, value if isinstance(value, bytes) else str(value).encode())
+
+    def incr(self, key):
+        self.set(key, int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def sadd(self, key, member):
+        members = set(self.data.get(key, set()))
+        members.add(member.encode())
+        self._write(key, members)
+
+    def smembers(self, key):
+        return self.data.get(key, set())
+
+    def pexpire(self, key, ms):
+        pass
+
+    def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            key = key.decode() if isinstance(key, bytes) else key
+            if key in self.data:
+                del self.data[key]
+                self.versions[key] = self.versions.get(key, 0) + 1
+                deleted += 1
+        return deleted
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+class FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._watched = {}
+        self._queued = []
+        self._buffering = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def watch(self, *keys):
+        self._watched = {key: self._redis.versions.get(key, 0) for key in keys}
+
+    def mget(self, keys):
+        return self._redis.mget(keys)
+
+    def multi(self):
+        self._buffering = True
+
+    def __getattr__(self, name):
+        command = getattr(self._redis, name)
+        return lambda *args, **kwargs: self._queued.append((command, args, kwargs))
+
+    def execute(self):
+        if self._redis.before_exec is not None:
+            before_exec, self._redis.before_exec = self._redis.before_exec, None
+            before_exec()
+        if any(self._redis.versions.get(key, 0) != version for key, version in self._watched.items()):
+            raise FakeWatchError()
+        return [command(*args, **kwargs) for command, args, kwargs in self._queued]
+
+@pytest.fixture
+def redis_cache():
+    # Built around the stand-in client, so the redis package is not needed
+    redis_cache = RedisCache.__new__(RedisCache)
+    CacheBackend.__init__(redis_cache)
+    redis_cache._redis = FakeRedis()
+    redis_cache._watch_error = FakeWatchError
+    return redis_cache
+
+def test_redis_set_and_invalidate(redis_cache):
+    redis_cache.set("feed", b"feed", ["post:1"], since=redis_cache.generation())
+    assert redis_cache.get("feed") == b"feed"
+    redis_cache.invalidate(["post:1"])
+    assert redis_cache.get("feed") is None
+    assert redis_cache.generation() == 1
+
+def test_redis_set_skipped_when_tag_invalidated_during_read(redis_cache):
+    since = redis_cache.generation()
+    redis_cache.invalidate(["post:1"])
+    redis_cache.set("feed", b"stale", ["post:1"], since=since)
+    assert redis_cache.get("feed") is None
+    assert redis_cache.stats()["stale_sets"] == 1
+
+def test_redis_watch_aborts_set_racing_an_invalidation(redis_cache):
+    since = redis_cache.generation()
+    # The invalidation lands after set() checked the stamps but before EXEC
+    redis_cache._redis.before_exec = lambda: redis_cache.invalidate(["post:1"])
+    redis_cache.set("feed", b"stale", ["post:1"], since=since)
+    assert redis_cache.get("feed") is None
+    stats = redis_cache.stats()
+    assert (stats["sets"], stats["stale_sets"]) == (0, 1)
+
+def test_redis_quiet_seconds(redis_cache, clock):
+    redis_cache.invalidate(["post:1"])
+    since = redis_cache.generation()
+    clock.now += 2
+    redis_cache.set("feed", b"replica", ["post:1"], since=since, quiet_seconds=5)
+    assert redis_cache.get("feed") is None
+    clock.now += 4
+    redis_cache.set("feed", b"replica", ["post:1"], since=since, quiet_seconds=5)
+    assert redis_cache.get("feed") == b"replica"
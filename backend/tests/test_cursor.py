@@ -0,0 +1,52 @@
+"""Keyset cursors: anything a client could tamper with is rejected with ValueError"""
+import base64
+import json
+import pytest
+from app.crud import _decode_cursor, _encode_cursor
+
+TYPES = ["integer", "integer"]
+
+def _raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def test_round_trip():
+    assert _decode_cursor(_encode_cursor("hot", [42, 7]), "hot", TYPES) == [42, 7]
+
+def test_float_keys_accept_integers():
+    assert _decode_cursor(_encode_cursor("trending", [3, 7]), "trending", ["float", "integer"]) == [3.0, 7]
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    "e30",  # {}
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+    _raw_cursor([1, 2]),
+])
+def test_rejects_undecodable_cursors(cursor):
+    with pytest.raises(ValueError):
+        _decode_cursor(cursor, "hot", TYPES)
+
+@pytest.mark.parametrize("sort, key", [
+    ("new", [1, 2]),
+    ("hot", [1]),
+    ("hot", [1, 2, 3]),
+    ("hot", {"a": 1}),
+])
+def test_rejects_cursors_for_another_sort(sort, key):
+    with pytest.raises(ValueError):
+        _decode_cursor(_encode_cursor(sort, key), "hot", TYPES)
+
+@pytest.mark.parametrize("key, types", [
+    ([True, 1], TYPES),
+    ([1, False], TYPES),
+    (["1", 2], TYPES),
+    ([1.5, 2], TYPES),
+    ([None, 2], TYPES),
+    ([2**31, 1], TYPES),
+    ([-2**31 - 1, 1], TYPES),
+    ([float("nan"), 1], ["float", "integer"]),
+    ([float("inf"), 1], ["float", "integer"]),
+    (["0.5", 1], ["float", "integer"]),
+])
+def test_rejects_values_that_do_not_fit_the_column(key, types):
+    with pytest.raises(ValueError):
+        _decode_cursor(_encode_cursor("hot", key), "hot", types)
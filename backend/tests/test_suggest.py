@@ -0,0 +1,109 @@
+"""Prefix index: the cached top lists for short prefixes agree with a full
+scan, also after incremental adds, and each post is indexed once"""
+import random
+import pytest
+from app.suggest import CACHED_PREFIX_LEN, PrefixIndex, _normalize
+
+WORDS = ["alpha", "alpine", "beta", "bet", "cloud", "clone", "delta", "data", "dash", "echo"]
+
+def _ranks(weights: dict, prefix: str) -> dict:
+    """Rank of every (kind, text) matching prefix, found by scanning all of them"""
+    prefix = _normalize(prefix)
+    ranks = {}
+    for (kind, value), weight in weights.items():
+        words = _normalize(value).split(" ")
+        starts = range(len(words)) if kind == "title" else [0]
+        matches = [(i == 0, weight) for i in starts if " ".join(words[i:]).startswith(prefix)]
+        if matches:
+            ranks[(kind, value)] = max(matches)
+    return ranks
+
+def _assert_ranked_like_a_full_scan(index: PrefixIndex, prefix: str, limit: int):
+    # Ties may be broken either way, so the rank sequences are compared
+    ranks = _ranks(index._weights, prefix)
+    completions = _completions(index, prefix, limit)
+    assert all(item in ranks for item in completions), prefix
+    assert [ranks[item] for item in completions] == sorted(ranks.values(), reverse=True)[:limit], prefix
+
+def _completions(index: PrefixIndex, prefix: str, limit: int) -> list:
+    return [(item["kind"], item["text"]) for item in index.complete(prefix, limit)]
+
+def _prefixes() -> list:
+    return sorted({word[:n] for word in WORDS for n in range(1, CACHED_PREFIX_LEN + 1)})
+
+def _random_posts(rng: random.Random, first_id: int, count: int) -> list:
+    votes = rng.sample(range(1, 100000), count)
+    return [
+        {
+            "id": first_id + n,
+            "title": " ".join(rng.sample(WORDS, 3)) + f" {first_id + n}",
+            "votes": votes[n],
+            "product": f"{rng.choice(WORDS)} product {first_id + n}",
+            "cause": rng.choice(WORDS),
+            "tags": rng.sample(WORDS, 2),
+        }
+        for n in range(count)
+    ]
+
+def _build(posts: list) -> PrefixIndex:
+    index = PrefixIndex()
+    items = []
+    for post in posts:
+        items.append(("title", post["title"], post["votes"], post["id"]))
+        items.append(("product", post["product"], 1, None))
+        items.append(("cause", post["cause"], 1, None))
+        items += [("tag", tag, 1, None) for tag in post["tags"]]
+    index.build(items)
+    return index
+
+def _assert_cached_tops_match(index: PrefixIndex):
+    for prefix in _prefixes():
+        _assert_ranked_like_a_full_scan(index, prefix, 50)
+
+def test_built_top_lists_match_a_full_scan():
+    index = _build(_random_posts(random.Random(1), 1, 300))
+    _assert_cached_tops_match(index)
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_top_lists_stay_current_as_posts_are_added(batched):
+    rng = random.Random(2)
+    index = _build(_random_posts(rng, 1, 200))
+    new_posts = _random_posts(rng, 201, 100)
+    if batched:
+        index.add_posts(new_posts)
+    else:
+        for post in new_posts:
+            index.add_post(post)
+    _assert_cached_tops_match(index)
+
+def test_short_and_long_prefixes_rank_alike():
+    index = _build(_random_posts(random.Random(3), 1, 200))
+    index.add_posts(_random_posts(random.Random(4), 201, 50))
+    for word in WORDS:
+        _assert_ranked_like_a_full_scan(index, word[:CACHED_PREFIX_LEN], 10)
+        _assert_ranked_like_a_full_scan(index, word, 10)
+
+def test_whole_title_matches_rank_above_word_matches():
+    index = PrefixIndex()
+    index.build([("title", "Cloud outage", 1, 1), ("title", "Big cloud bill", 100, 2)])
+    for prefix in ("clo", "cloud"):
+        assert _completions(index, prefix, 2) == [("title", "Cloud outage"), ("title", "Big cloud bill")]
+
+def test_a_post_is_indexed_once():
+    index = PrefixIndex()
+    index.build([("title", "Cloud outage", 5, 1)])
+    post = {"id": 2, "title": "Cloud bill", "votes": 3, "product": "Cloudy", "cause": "cost", "tags": ["cloud"]}
+    index.add_post(post)
+    index.add_posts([post])
+    index.add_post(post)
+    assert index._weights[("title", "Cloud bill")] == 3
+    assert index._weights[("tag", "cloud")] == 1
+    assert index.complete("cloud b") == [{"text": "Cloud bill", "kind": "title", "post_id": 2}]
+
+def test_unindexed_ids_reports_gaps_below_the_highest_id():
+    index = PrefixIndex()
+    index.build([("title", "one", 1, 1), ("title", "two", 1, 2)])
+    index.add_post({"id": 5, "title": "five", "votes": 1, "product": "p", "cause": "c", "tags": []})
+    assert index.unindexed_ids() == (5, [3, 4])
+    index.add_posts([{"id": 4, "title": "four", "votes": 1, "product": "p", "cause": "c", "tags": []}])
+    assert index.unindexed_ids() == (5, [3])
@@ -62,7 +62,7 @@ export default function Home() {
           });
         }
         setPosts(response.items);
-        setTotal(response.total);
+        setTotal(response.total ?? response.items.length);
         // Refetch analytics when posts are successfully fetched (only for feed view)
         if (view === 'feed') {
           try {
@@ -153,7 +153,7 @@ export default function Home() {
           getTopCauses(),
         ]);
         setPosts(postsResponse.items);
-        setTotal(postsResponse.total);
+        setTotal(postsResponse.total ?? postsResponse.items.length);
         setAnalytics(analyticsResponse.items);
       } catch (refetchErr) {
         console.error('[Failure Atlas] Error refetching data after post creation:', refetchErr instanceof Error ? refetchErr.message : 'Unknown error', refetchErr);
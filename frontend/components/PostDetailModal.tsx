@@ -2,7 +2,11 @@
 
 import { useEffect, useState } from 'react';
 import type { Post, Comment } from '@/lib/api';
-import { fetchComments, addComment } from '@/lib/api';
+import { fetchComments, addComment, subscribePostEvents } from '@/lib/api';
+
+// Newest comments shown when the modal opens; the full thread is paged on demand
+const PREVIEW_COMMENTS = 10;
+const COMMENTS_PAGE_SIZE = 50;
 
 interface PostDetailModalProps {
   post: Post | null;
@@ -15,6 +19,11 @@ export default function PostDetailModal({ post, isOpen, onClose, onPostUpdate }:
   const [comments, setComments] = useState<Comment[]>([]);
   const [commentText, setCommentText] = useState('');
   const [isLoadingComments, setIsLoadingComments] = useState(false);
+  const [showingAll, setShowingAll] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  // Comments by other users that arrived over the live stream since opening
+  const [liveCommentCount, setLiveCommentCount] = useState(0);
   const [isSubmittingComment, setIsSubmittingComment] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
@@ -23,20 +32,44 @@ export default function PostDetailModal({ post, isOpen, onClose, onPostUpdate }:
       loadComments();
     } else {
       setComments([]);
+      setShowingAll(false);
+      setNextCursor(null);
+      setLiveCommentCount(0);
       setCommentText('');
       setError(null);
     }
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [isOpen, post]);
 
+  // Push new comments from other users instead of refetching
+  useEffect(() => {
+    if (!isOpen || !post) return;
+    const userId = localStorage.getItem('fa_user_id');
+    return subscribePostEvents(
+      [post.id],
+      (event) => {
+        // Our own comments are added by handleSubmitComment
+        if (event.type !== 'comment' || event.comment?.user_id === userId) return;
+        setLiveCommentCount((count) => count + 1);
+        const comment = event.comment;
+        if (!comment) return;
+        setComments((prev) => (prev.some((c) => c.id === comment.id) ? prev : [...prev, comment]));
+      },
+      () => loadComments()
+    );
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [isOpen, post?.id]);
+
   const loadComments = async () => {
     if (!post) return;
     
     setIsLoadingComments(true);
     setError(null);
     try {
-      const fetchedComments = await fetchComments(post.id);
-      setComments(fetchedComments);
+      const { items } = await fetchComments(post.id, { latest: PREVIEW_COMMENTS });
+      setComments(items);
+      setShowingAll(false);
+      setNextCursor(null);
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Failed to load comments');
       console.error('Error loading comments:', err);
@@ -45,6 +78,28 @@ export default function PostDetailModal({ post, isOpen, onClose, onPostUpdate }:
     }
   };
 
+  // First page of the full thread (oldest first), or the page after nextCursor
+  const loadCommentPage = async (cursor: string | null) => {
+    if (!post) return;
+    
+    setIsLoadingMore(true);
+    setError(null);
+    try {
+      const page = await fetchComments(post.id, { cursor, limit: COMMENTS_PAGE_SIZE });
+      // Skip comments that already arrived over the live stream
+      setComments((prev) =>
+        cursor ? [...prev, ...page.items.filter((item) => !prev.some((c) => c.id === item.id))] : page.items
+      );
+      setShowingAll(true);
+      setNextCursor(page.next_cursor ?? null);
+    } catch (err) {
+      setError(err instanceof Error ? err.message : 'Failed to load comments');
+      console.error('Error loading comments:', err);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const handleSubmitComment = async (e: React.FormEvent) => {
     e.preventDefault();
     if (!post || !commentText.trim()) return;
@@ -113,7 +168,7 @@ export default function PostDetailModal({ post, isOpen, onClose, onPostUpdate }:
           </div>
 
           <div style={{ borderTop: '1px solid var(--border)', paddingTop: '24px' }}>
-            <h3 style={{ marginBottom: '16px', fontSize: '18px', fontWeight: 700 }}>Comments ({comments.length})</h3>
+            <h3 style={{ marginBottom: '16px', fontSize: '18px', fontWeight: 700 }}>Comments ({Math.max((post.comment_count ?? 0) + liveCommentCount, comments.length)})</h3>
             
             {error && (
               <div style={{ marginBottom: '16px', padding: '12px', background: 'rgba(234, 67, 53, 0.1)', border: '1px solid rgba(234, 67, 53, 0.3)', borderRadius: '8px', color: 'var(--danger)', fontSize: '13px' }}>
@@ -144,6 +199,16 @@ export default function PostDetailModal({ post, isOpen, onClose, onPostUpdate }:
                     <div style={{ fontSize: '14px', lineHeight: '1.6' }}>{comment.content}</div>
                   </div>
                 ))}
+                {!showingAll && (post.comment_count ?? 0) + liveCommentCount > comments.length && (
+                  <button type="button" className="btn" onClick={() => loadCommentPage(null)} disabled={isLoadingMore}>
+                    {isLoadingMore ? 'Loading…' : `View all ${(post.comment_count ?? 0) + liveCommentCount} comments`}
+                  </button>
+                )}
+                {showingAll && nextCursor && (
+                  <button type="button" className="btn" onClick={() => loadCommentPage(nextCursor)} disabled={isLoadingMore}>
+                    {isLoadingMore ? 'Loading…' : 'Load more comments'}
+                  </button>
+                )}
               </div>
             )}
 
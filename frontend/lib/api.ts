@@ -22,6 +22,28 @@ function getUserId(): string | null {
   return userId;
 }
 
+const PRIMARY_UNTIL_KEY = 'fa_primary_until';
+
+/**
+ * Remember the read-your-writes token a write response carries, so the
+ * following reads are served by the primary and see the write
+ */
+function rememberPrimaryUntil(response: Response): void {
+  const token = response.headers.get('X-Primary-Until');
+  if (token && typeof window !== 'undefined') {
+    localStorage.setItem(PRIMARY_UNTIL_KEY, token);
+  }
+}
+
+/**
+ * Header sending the last write's token back on reads (the server ignores it once expired)
+ */
+function primaryUntilHeader(): Record<string, string> {
+  if (typeof window === 'undefined') return {};
+  const token = localStorage.getItem(PRIMARY_UNTIL_KEY);
+  return token ? { 'X-Primary-Until': token } : {};
+}
+
 // Helper function to parse error response and throw a nice error
 async function handleErrorResponse(response: Response): Promise<never> {
   let errorMessage = response.statusText;
@@ -108,6 +130,15 @@ export interface Comment {
   created_at: string;
 }
 
+export interface CommentsResponse {
+  items: Comment[];
+  next_cursor?: string | null;
+}
+
+export type PostEvent =
+  | { type: 'vote'; post_id: number; votes: number }
+  | { type: 'comment'; post_id: number; comment?: Comment };
+
 export interface AuthResponse {
   user_id: string;
 }
@@ -120,7 +151,18 @@ export interface VoteResponse {
 
 export interface PostsResponse {
   items: Post[];
-  total: number;
+  total: number | null;
+  next_cursor?: string | null;
+}
+
+export interface UserPostState {
+  post_id: number;
+  user_vote: number;
+  saved: boolean;
+}
+
+export interface UserStateResponse {
+  items: UserPostState[];
 }
 
 export interface CauseAnalytics {
@@ -160,15 +202,21 @@ export async function getPosts(params?: {
   if (params?.cause && params.cause !== 'all') searchParams.append('cause', params.cause);
   if (params?.severity && params.severity !== 'all') searchParams.append('severity', params.severity);
   if (params?.sort) searchParams.append('sort', params.sort);
+  // Fetch the shared (cacheable) page and merge in the per-user overlay
+  searchParams.append('view', 'shared');
 
   const queryString = searchParams.toString();
-  const url = `${API_BASE_URL}/posts${queryString ? `?${queryString}` : ''}`;
+  const url = `${API_BASE_URL}/posts?${queryString}`;
   const userId = getUserId();
 
+  // Revalidate with the server's ETag instead of always refetching. The
+  // read-your-writes token is signed for the user, so it goes with their id:
+  // right after their own write the page is read from the primary
   const response = await fetch(url, {
-    cache: 'no-store',
+    cache: 'no-cache',
     headers: {
       ...(userId && { 'X-User-Id': userId }),
+      ...primaryUntilHeader(),
     },
   });
 
@@ -176,7 +224,41 @@ export async function getPosts(params?: {
     await handleErrorResponse(response);
   }
 
-  return response.json();
+  const page: PostsResponse = await response.json();
+  if (!userId || page.items.length === 0) {
+    return page;
+  }
+
+  const states = await getUserState(userId, page.items.map((post) => post.id));
+  return {
+    ...page,
+    items: page.items.map((post) => ({ ...post, ...states.get(post.id) })),
+  };
+}
+
+/**
+ * Get the current user's vote and saved state for a page of posts
+ */
+async function getUserState(
+  userId: string,
+  postIds: number[]
+): Promise<Map<number, { user_vote: number; saved: boolean }>> {
+  const url = `${API_BASE_URL}/me/state?post_ids=${postIds.join(',')}`;
+
+  const response = await fetch(url, {
+    cache: 'no-store',
+    headers: {
+      'X-User-Id': userId,
+      ...primaryUntilHeader(),
+    },
+  });
+
+  if (!response.ok) {
+    await handleErrorResponse(response);
+  }
+
+  const data: UserStateResponse = await response.json();
+  return new Map(data.items.map((item) => [item.post_id, { user_vote: item.user_vote, saved: item.saved }]));
 }
 
 /**
@@ -213,6 +295,7 @@ export async function getTopCauses(): Promise<TopCausesResponse> {
     cache: 'no-store',
     headers: {
       ...(userId && { 'X-User-Id': userId }),
+      ...primaryUntilHeader(),
     },
   });
 
@@ -248,21 +331,34 @@ export async function votePost(postId: number, value: -1 | 0 | 1): Promise<VoteR
   if (!response.ok) {
     await handleErrorResponse(response);
   }
+  rememberPrimaryUntil(response);
 
   return response.json();
 }
 
 /**
- * Get comments for a post
+ * Get comments for a post: a page (oldest first) after an optional cursor,
+ * or only the newest `latest` comments
  */
-export async function fetchComments(postId: number): Promise<Comment[]> {
+export async function fetchComments(
+  postId: number,
+  options: { cursor?: string | null; limit?: number; latest?: number } = {}
+): Promise<CommentsResponse> {
   const userId = getUserId();
-  const url = `${API_BASE_URL}/posts/${postId}/comments`;
+  const params = new URLSearchParams();
+  if (options.latest) {
+    params.set('latest', String(options.latest));
+  } else {
+    if (options.cursor) params.set('cursor', options.cursor);
+    if (options.limit) params.set('limit', String(options.limit));
+  }
+  const url = `${API_BASE_URL}/posts/${postId}/comments?${params.toString()}`;
   
   const response = await fetch(url, {
     cache: 'no-store',
     headers: {
       ...(userId && { 'X-User-Id': userId }),
+      ...primaryUntilHeader(),
     },
   });
 
@@ -271,7 +367,35 @@ export async function fetchComments(postId: number): Promise<Comment[]> {
   }
 
   const data = await response.json();
-  return data.items || [];
+  return { items: data.items || [], next_cursor: data.next_cursor ?? null };
+}
+
+/**
+ * Follow live vote and comment events on the given posts (server-sent events).
+ * onReset is called when the stream reconnects, since events may have been
+ * missed in between. Returns a function that closes the stream.
+ */
+export function subscribePostEvents(
+  postIds: number[],
+  onEvent: (event: PostEvent) => void,
+  onReset?: () => void
+): () => void {
+  const params = new URLSearchParams();
+  postIds.forEach((id) => params.append('post', String(id)));
+  const source = new EventSource(`${API_BASE_URL}/stream?${params.toString()}`);
+  let opened = false;
+
+  const handle = (message: MessageEvent) => onEvent(JSON.parse(message.data) as PostEvent);
+  source.addEventListener('vote', handle);
+  source.addEventListener('comment', handle);
+  // The server closes a stream that fell behind; EventSource reconnects on its own
+  source.addEventListener('overflow', () => onReset?.());
+  source.onopen = () => {
+    if (opened) onReset?.();
+    opened = true;
+  };
+
+  return () => source.close();
 }
 
 /**
@@ -306,6 +430,7 @@ export async function addComment(postId: number, content: string): Promise<Comme
     console.error('Comment failed:', response.status, error);
     await handleErrorResponse(response);
   }
+  rememberPrimaryUntil(response);
 
   return response.json();
 }
@@ -328,6 +453,7 @@ export async function savePost(postId: number): Promise<void> {
   if (!response.ok) {
     await handleErrorResponse(response);
   }
+  rememberPrimaryUntil(response);
 }
 
 /**
@@ -348,6 +474,7 @@ export async function unsavePost(postId: number): Promise<void> {
   if (!response.ok) {
     await handleErrorResponse(response);
   }
+  rememberPrimaryUntil(response);
 }
 
 /**
@@ -365,6 +492,7 @@ export async function fetchSaved(): Promise<PostsResponse> {
     cache: 'no-store',
     headers: {
       'X-User-Id': userId,
+      ...primaryUntilHeader(),
     },
   });
 